@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Backfill throughput against a local stub node with a simulated round
+trip time: the serial 2.9 walk against Backfill at growing parallelism."""
+
+from __future__ import print_function
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bts.ws.backfill import Backfill  # noqa
+from bts.ws.base_protocol import BaseProtocol  # noqa
+from stub_node import StubChain, StubWSNode  # noqa
+
+
+async def connect(node):
+    protocol = BaseProtocol(node.uri, reconnect=False)
+    task = asyncio.ensure_future(protocol.handler())
+    await protocol.ready.wait()
+    return protocol, task
+
+
+async def walk(protocol, chain, limit):
+    # what StatisticsProtocol did before: one request per history entry
+    # and one per operation, too slow to wait for all of them
+    count = 0
+    trx_id = chain.statistics["most_recent_op"]
+    while trx_id != "2.9.9" and count < limit:
+        trx = (await protocol.node_api.get_objects([trx_id]))[0]
+        await protocol.node_api.get_objects([trx["operation_id"]])
+        trx_id = trx["next"]
+        count += 1
+    return count
+
+
+async def bench(operations, delay):
+    chain = StubChain()
+    for i in range(operations):
+        chain.fill((i, "1.3.0"), (1, "1.3.1"))
+    node = await StubWSNode(chain.handlers(), delay=delay).start()
+    protocol, task = await connect(node)
+    print("%d operations, %.0f ms rtt" % (operations, delay * 1000))
+    start = time.time()
+    count = await walk(protocol, chain, 100)
+    print("  %-14s %8.0f ops/s" % ("serial walk", count / (
+        time.time() - start)))
+    for parallelism in (1, 4, 16):
+        backfill = Backfill(
+            protocol, chain.account["id"], lambda op: None,
+            parallelism=parallelism)
+        count = await backfill.run()
+        print("  %-14s %8.0f ops/s" % (
+            "parallelism %d" % parallelism,
+            count / backfill.stats["elapsed"]))
+    await protocol.close()
+    await task
+    await node.stop()
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(bench(2000, 0.02))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Decode/encode throughput of the available JSON codecs.
+
+Pass files holding recorded node replies (one JSON document per file) to
+benchmark those, otherwise synthetic get_block and notification payloads
+of realistic shape are used.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bts.codec import get_codec  # noqa
+
+
+def synthetic_block(transactions=200):
+    op = [4, {"fee": {"amount": 0, "asset_id": "1.3.0"},
+              "order_id": "1.7.123456", "account_id": "1.2.100",
+              "pays": {"amount": 123456789, "asset_id": "1.3.0"},
+              "receives": {"amount": 98765, "asset_id": "1.3.113"}}]
+    trx = {"ref_block_num": 1234, "ref_block_prefix": 3456789012,
+           "expiration": "2016-08-01T00:00:00", "operations": [op] * 3,
+           "extensions": [], "signatures": ["1f" + "ab" * 64]}
+    block = {"previous": "00" * 20, "timestamp": "2016-08-01T00:00:00",
+             "witness": "1.6.1", "transaction_merkle_root": "00" * 20,
+             "extensions": [], "witness_signature": "20" + "cd" * 64,
+             "transactions": [trx] * transactions}
+    return {"id": 1, "jsonrpc": "2.0", "result": block}
+
+
+def synthetic_notice(objects=200):
+    notice = {"id": "2.6.100", "owner": "1.2.100",
+              "most_recent_op": "2.9.123456", "total_ops": 5000,
+              "total_core_in_orders": "1234567890",
+              "lifetime_fees_paid": 12345, "pending_fees": 0,
+              "pending_vested_fees": 0}
+    return {"method": "notice", "params": [200, [[notice] * objects]]}
+
+
+def bench(codec, data, rounds):
+    obj = codec.loads(data)
+    start = time.time()
+    for i in range(rounds):
+        codec.loads(data)
+    decode = (time.time() - start) / rounds
+    start = time.time()
+    for i in range(rounds):
+        codec.dumps(obj)
+    encode = (time.time() - start) / rounds
+    return decode, encode
+
+
+def main(paths, rounds=200):
+    stdlib = get_codec("json")
+    payloads = []
+    for path in paths:
+        with open(path, "rb") as f:
+            payloads.append((os.path.basename(path), f.read()))
+    if not payloads:
+        payloads = [
+            ("get_block", stdlib.dumps(synthetic_block())),
+            ("notice", stdlib.dumps(synthetic_notice()))]
+    for name in ("json", "ujson", "orjson"):
+        try:
+            codec = get_codec(name)
+        except ImportError:
+            print("%-8s not installed" % name)
+            continue
+        for payload_name, data in payloads:
+            decode, encode = bench(codec, data, rounds)
+            print("%-8s %-12s %7d bytes  loads %8.1f us  dumps %8.1f us" % (
+                name, payload_name, len(data), decode * 1e6, encode * 1e6))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
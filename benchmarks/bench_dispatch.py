@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Notice dispatch with 10k subscriptions: the old linear prefix scan
+against the SubscriptionIndex used by BaseProtocol."""
+
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bts.ws.subscriptions import SubscriptionIndex  # noqa
+
+
+def linear_match(callbacks, object_id):
+    return [_cb for _id in callbacks if _id == object_id[:len(_id)]
+            for _cb in callbacks[_id]]
+
+
+def bench(name, match, notices):
+    start = time.time()
+    matched = 0
+    for object_id in notices:
+        matched += len(match(object_id))
+    elapsed = time.time() - start
+    print("%-8s %10.0f notices/s (%d callbacks)" % (
+        name, len(notices) / elapsed, matched))
+
+
+def main(subscriptions=10000, notices=2000):
+    rand = random.Random(0)
+    callbacks = {}
+    index = SubscriptionIndex()
+    for i in range(subscriptions):
+        key = "2.6.%d" % rand.randint(0, 10 ** 6)
+        callbacks.setdefault(key, []).append(i)
+        index.add(key, i)
+    for key in ("2.1.0", "1.3."):
+        callbacks[key] = [key]
+        index.add(key, key)
+    ids = list(callbacks)
+    sample = [rand.choice(ids) if rand.random() < 0.5 else
+              "2.6.%d" % rand.randint(0, 10 ** 6) for i in range(notices)]
+    bench("linear", lambda _id: linear_match(callbacks, _id), sample)
+    bench("index", index.match, sample)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Calls per second of HTTPRPC against a local stub node, comparing a fresh
+connection per call with the pooled keep-alive session."""
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bts.http_rpc import HTTPRPC  # noqa
+from stub_node import StubHTTPNode  # noqa
+
+
+def bench(name, func, calls):
+    start = time.time()
+    for i in range(calls):
+        func(i)
+    elapsed = time.time() - start
+    print("%-16s %8.0f calls/s" % (name, calls / elapsed))
+
+
+def main(calls=2000):
+    with StubHTTPNode() as node:
+        headers = {'content-type': 'application/json'}
+
+        def unpooled(i):
+            query = {"method": "call", "jsonrpc": "2.0", "id": 0,
+                     "params": [0, "get_objects", [["1.11.%d" % i]]]}
+            requests.post(node.uri, data=json.dumps(query), headers=headers)
+
+        rpc = HTTPRPC(node.uri)
+
+        def pooled(i):
+            rpc.get_objects(["1.11.%d" % i])
+
+        bench("requests.post", unpooled, calls)
+        bench("HTTPRPC pooled", pooled, calls)
+        rpc.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Memo decoding throughput.
+
+Memos from a number of senders to one memo key are generated locally and
+decoded the way TransferProtocol used to (parsing both keys and running
+the ECDH for every memo), with a MemoDecoder and its secret cache, and
+with decode_many over a process pool.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bts.memo import MemoDecoder  # noqa
+from graphenebase import PrivateKey, PublicKey  # noqa
+from graphenebase import memo as Memo  # noqa
+
+
+def generate(key, count, senders):
+    senders = [PrivateKey() for i in range(senders)]
+    memos = []
+    for n in range(count):
+        sender = senders[n % len(senders)]
+        memos.append((
+            format(sender.pubkey, "BTS"), n,
+            Memo.encode_memo(sender, key.pubkey, n, "deposit %d" % n)))
+    return memos
+
+
+def naive(memo_key, memos):
+    for public_key, nonce, message in memos:
+        Memo.decode_memo(PrivateKey(memo_key), PublicKey(
+            public_key, prefix="BTS"), nonce, message)
+
+
+def report(name, count, elapsed):
+    print("%-24s %8.0f memos/s" % (name, count / elapsed))
+
+
+def bench(key, memos, senders, processes):
+    count = len(memos)
+    print("%d memos from %d senders" % (count, senders))
+    start = time.time()
+    naive(str(key), memos[:200])
+    report("per memo key and ECDH", min(count, 200), time.time() - start)
+    start = time.time()
+    MemoDecoder(str(key)).decode_all(memos)
+    report("MemoDecoder", count, time.time() - start)
+    with ProcessPoolExecutor(processes) as executor:
+        # start the workers before timing
+        MemoDecoder(str(key)).decode_many(memos[:processes], executor, 1)
+        start = time.time()
+        MemoDecoder(str(key)).decode_many(memos, executor)
+        report("decode_many, %d processes" % processes, count,
+               time.time() - start)
+
+
+def main(processes=None):
+    processes = processes or os.cpu_count()
+    key = PrivateKey()
+    # few senders, the secret cache does the work
+    bench(key, generate(key, 2000, 20), 20, processes)
+    # every sender new, each memo needs its own ECDH
+    bench(key, generate(key, 1000, 1000), 1000, processes)
+
+
+if __name__ == "__main__":
+    main()
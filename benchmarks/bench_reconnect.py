@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Downtime-to-resync: kill a local stub node, let operations pile up,
+restart it and time how long the TradeProtocol needs to catch up."""
+
+from __future__ import print_function
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bts.ws.trade_protocol import TradeProtocol  # noqa
+from stub_node import StubChain, StubWSNode  # noqa
+
+
+class CountingTrade(TradeProtocol):
+    trades = 0
+
+    def onTrade(self, trx):
+        self.trades += 1
+
+
+async def wait_for(condition):
+    while not condition():
+        await asyncio.sleep(0.001)
+
+
+async def bench(missed, delay):
+    chain = StubChain()
+    node = await StubWSNode(chain.handlers(), delay=delay).start()
+    protocol = CountingTrade(node.uri, reconnect_delay=0.05)
+    protocol.init_statistics(None, chain.account["name"])
+    task = asyncio.ensure_future(protocol.handler())
+    await wait_for(protocol.ready.is_set)
+    await node.stop()
+    for i in range(missed):
+        chain.fill((100000, "1.3.0"), (20000, "1.3.1"))
+    restarted = time.time()
+    node = await StubWSNode(chain.handlers(), delay=delay).start(node.port)
+    await wait_for(lambda: protocol.connections == 2)
+    reconnected = time.time()
+    await wait_for(lambda: protocol.trades == missed)
+    done = time.time()
+    print("%5d missed ops, %3.0f ms rtt: reconnect %6.3f s, resync %6.3f s"
+          % (missed, delay * 1000, reconnected - restarted,
+             done - reconnected))
+    await protocol.close()
+    await task
+    await node.stop()
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    for missed, delay in ((100, 0), (1000, 0), (100, 0.005)):
+        loop.run_until_complete(bench(missed, delay))
+
+
+if __name__ == '__main__':
+    main()
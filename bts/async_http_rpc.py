@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Awaitable counterpart of :class:`bts.http_rpc.HTTPRPC` for asyncio code."""
+
+import itertools
+import time
+
+from bts.codec import default_codec
+from bts.http_rpc import (
+    API_NAMES, UnauthorizedError, RPCConnection, rpc_error)
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+try:
+    import aiohttp
+except ImportError:
+    raise ImportError("Missing dependency: aiohttp")
+
+
+class AsyncHTTPRPC(object):
+    def __init__(self, uri="", username="", password="",
+                 pool_maxsize=10, limit_per_host=10, idle_timeout=60,
+                 max_concurrency=20, codec=None, metrics=None):
+        if not uri:
+            uri = "https://bitshares.openledger.info/ws"
+        uri = uri.replace("wss://", "https://")
+        self.uri = uri
+        self.username = username
+        self.password = password
+        self.headers = {'content-type': 'application/json'}
+        self.codec = codec or default_codec
+        # optional bts.metrics.RPCMetrics, None disables instrumentation
+        self.metrics = metrics
+        self.pool_maxsize = pool_maxsize
+        self.limit_per_host = limit_per_host
+        self.idle_timeout = idle_timeout
+        # calls beyond max_concurrency wait for a free slot instead of
+        # piling up on the node
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._session = None
+        self._ids = itertools.count(1)
+
+    def _get_session(self):
+        # aiohttp sessions are bound to the running loop, so they are
+        # created on first use rather than in __init__
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_maxsize,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.idle_timeout)
+            auth = None
+            if self.username:
+                auth = aiohttp.BasicAuth(self.username, self.password)
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers=self.headers, auth=auth)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _post(self, data):
+        session = self._get_session()
+        try:
+            async with self._semaphore:
+                async with session.post(self.uri, data=data) as response:
+                    if response.status == 401:
+                        raise UnauthorizedError
+                    content = await response.read()
+                    return self.codec.loads(content), len(content)
+        except aiohttp.ClientError:
+            raise RPCConnection("Error connecting. Check hostname and port!")
+        except UnauthorizedError:
+            raise UnauthorizedError("Invalid login credentials!")
+        except ValueError:
+            raise ValueError("Client returned invalid format. Expected JSON!")
+
+    async def _post_measured(self, api, method, data):
+        start = time.time()
+        try:
+            ret, received = await self._post(data)
+        except Exception:
+            self.metrics.record(
+                api, method, time.time() - start, True, len(data))
+            raise
+        self.metrics.record(
+            api, method, time.time() - start, 'error' in ret, len(data),
+            received)
+        return ret, received
+
+    async def rpcexec(self, payload):
+        data = self.codec.dumps(payload)
+        if self.metrics is None:
+            ret, received = await self._post(data)
+        else:
+            api, method = payload["params"][:2]
+            ret, received = await self._post_measured(
+                API_NAMES.get(api, api), method, data)
+        if 'error' in ret:
+            raise rpc_error(ret['error'], data)
+        return ret["result"]
+
+    def new_query(self, name, args):
+        return {
+            "method": "call",
+            "params": [0, name, args],
+            "jsonrpc": "2.0",
+            "id": next(self._ids)
+        }
+
+    """
+    Meta:Map all methods to RPC calls and pass through the arguments and result
+    """
+    def __getattr__(self, name):
+        async def method(*args):
+            return await self.rpcexec(self.new_query(name, args))
+        return method
+
+
+if __name__ == '__main__':
+    import sys
+    from pprint import pprint
+    uri = ""
+    if len(sys.argv) >= 2:
+        uri = sys.argv[1]
+
+    async def main():
+        async with AsyncHTTPRPC(uri) as rpc:
+            pprint(await rpc.get_dynamic_global_properties())
+    asyncio.get_event_loop().run_until_complete(main())
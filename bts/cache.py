@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Read-through cache for chain data that never changes once written.
+
+Operation history objects (1.11.x), account transaction history objects
+(2.9.x) and blocks at or below the last irreversible block are immutable,
+so once fetched they can be served without asking the node again. Every
+other call goes to the network untouched.
+"""
+
+import shelve
+import threading
+from collections import OrderedDict
+
+IMMUTABLE_SPACES = ("1.11.", "2.9.")
+BLOCK_METHODS = ("get_block", "get_block_header")
+MISSING = object()
+
+
+def is_immutable_object(object_id):
+    return object_id.startswith(IMMUTABLE_SPACES)
+
+
+class ObjectCache(object):
+    def __init__(self, max_size=10000, spill_path=None):
+        self.max_size = max_size
+        self.last_irreversible_block = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # entries evicted from memory go to disk when spill_path is set
+        self._spill = None
+        if spill_path:
+            self._spill = shelve.open(spill_path)
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def set_irreversible(self, block_num):
+        if block_num > self.last_irreversible_block:
+            self.last_irreversible_block = block_num
+
+    def update_global_properties(self, properties):
+        if properties and "last_irreversible_block_num" in properties:
+            self.set_irreversible(properties["last_irreversible_block_num"])
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            if self._spill is not None and key in self._spill:
+                self.hits += 1
+                value = self._spill[key]
+                self._put(key, value)
+                return value
+            self.misses += 1
+            return MISSING
+
+    def _put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            old_key, old_value = self._data.popitem(last=False)
+            if self._spill is not None:
+                self._spill[old_key] = old_value
+
+    def put(self, key, value):
+        with self._lock:
+            self._put(key, value)
+
+    def lookup(self, method, args):
+        """Return ``(fetch_args, partial)``.
+
+        ``fetch_args`` is None when the call is served entirely from the
+        cache, otherwise it holds the arguments still to be sent to the
+        node. Either way pass the node's reply (or None) and ``partial`` to
+        :meth:`complete` to get the result of the original call.
+        """
+        if method == "get_objects":
+            found = {}
+            missing = []
+            for object_id in args[0]:
+                value = MISSING
+                if is_immutable_object(object_id):
+                    value = self._get("obj:%s" % object_id)
+                if value is MISSING:
+                    missing.append(object_id)
+                else:
+                    found[object_id] = value
+            if not missing:
+                return None, found
+            return [missing], found
+        if method in BLOCK_METHODS and \
+                int(args[0]) <= self.last_irreversible_block:
+            value = self._get("%s:%s" % (method, args[0]))
+            if value is not MISSING:
+                return None, value
+        return args, None
+
+    def complete(self, method, args, partial, reply):
+        if method == "get_objects":
+            fetched = iter(reply or [])
+            result = []
+            for object_id in args[0]:
+                if object_id in partial:
+                    result.append(partial[object_id])
+                    continue
+                obj = next(fetched)
+                if obj is not None and is_immutable_object(object_id):
+                    self.put("obj:%s" % object_id, obj)
+                if object_id == "2.1.0":
+                    self.update_global_properties(obj)
+                result.append(obj)
+            return result
+        if reply is None:
+            return partial
+        if method == "get_dynamic_global_properties":
+            self.update_global_properties(reply)
+        elif method in BLOCK_METHODS and \
+                int(args[0]) <= self.last_irreversible_block:
+            self.put("%s:%s" % (method, args[0]), reply)
+        return reply
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "last_irreversible_block": self.last_irreversible_block}
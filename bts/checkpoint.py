@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Durable monitor checkpoints.
+
+A checkpoint store keeps a small JSON-able state per key, e.g. the last
+processed operation of a monitored account. ``save`` only updates memory,
+the states are written out together at most every ``flush_interval``
+seconds (or on every save with 0), so a busy monitor doesn't pay a
+synchronous write per operation. Call ``flush`` or ``close`` on shutdown.
+
+:class:`FileCheckpoint` rewrites one JSON file atomically, a temp file is
+fsynced and renamed over the old one. :class:`SQLiteCheckpoint` keeps the
+states in a table and writes each flush in one transaction.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+
+class CheckpointStore(object):
+    def __init__(self, flush_interval=1.0):
+        self.flush_interval = flush_interval
+        self.flushes = 0
+        self._states = None
+        self._dirty = {}
+        self._last_flush = time.time()
+
+    def _read(self):
+        raise NotImplementedError
+
+    def _write(self, states):
+        raise NotImplementedError
+
+    def load(self, key):
+        if self._states is None:
+            self._states = self._read()
+        return self._states.get(key)
+
+    def save(self, key, state):
+        if self._states is None:
+            self._states = self._read()
+        self._states[key] = self._dirty[key] = dict(state)
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def dirty(self):
+        return bool(self._dirty)
+
+    def flush(self):
+        self._last_flush = time.time()
+        if not self._dirty:
+            return
+        self._write(self._dirty)
+        self._dirty = {}
+        self.flushes += 1
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FileCheckpoint(CheckpointStore):
+    def __init__(self, path, flush_interval=1.0):
+        super(FileCheckpoint, self).__init__(flush_interval)
+        self.path = path
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError):
+            return {}
+
+    def _write(self, states):
+        # the file holds every key, not only the changed ones
+        tmp = "%s.tmp" % self.path
+        with open(tmp, "w") as f:
+            json.dump(self._states, f, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)),
+                         os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+class SQLiteCheckpoint(CheckpointStore):
+    def __init__(self, path, flush_interval=1.0):
+        super(SQLiteCheckpoint, self).__init__(flush_interval)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints "
+            "(key TEXT PRIMARY KEY, state TEXT NOT NULL)")
+        self.db.commit()
+
+    def _read(self):
+        return dict(
+            (key, json.loads(state)) for key, state in
+            self.db.execute("SELECT key, state FROM checkpoints"))
+
+    def _write(self, states):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO checkpoints (key, state) "
+                "VALUES (?, ?)",
+                [(key, json.dumps(state, sort_keys=True))
+                 for key, state in states.items()])
+
+    def close(self):
+        super(SQLiteCheckpoint, self).close()
+        self.db.close()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""JSON codec used on the HTTP and websocket paths.
+
+orjson or ujson are used when installed, otherwise the stdlib json module.
+``dumps`` always returns utf8 bytes and ``loads`` accepts bytes as well as
+str, so replies can be decoded without an intermediate str copy.
+"""
+
+import json
+
+
+class Codec(object):
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return "<Codec %s>" % self.name
+
+
+def _stdlib_codec():
+    def dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf8')
+    return Codec("json", dumps, json.loads)
+
+
+def _orjson_codec():
+    import orjson
+    return Codec("orjson", orjson.dumps, orjson.loads)
+
+
+def _ujson_codec():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode('utf8')
+    return Codec("ujson", dumps, ujson.loads)
+
+
+_factories = {
+    "orjson": _orjson_codec,
+    "ujson": _ujson_codec,
+    "json": _stdlib_codec,
+}
+
+
+def get_codec(name=None):
+    """Return the codec called ``name``, or the fastest one available."""
+    if name is not None:
+        return _factories[name]()
+    for name in ("orjson", "ujson"):
+        try:
+            return _factories[name]()
+        except ImportError:
+            pass
+    return _stdlib_codec()
+
+
+default_codec = get_codec()
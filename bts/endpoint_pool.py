@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Latency aware choice between several API nodes.
+
+Every endpoint keeps a rolling round trip time and an error score that
+fades out over time, calls go to the endpoint with the best score.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class Endpoint(object):
+    def __init__(self, uri, window=100, error_penalty=1.0,
+                 error_half_life=30.0):
+        self.uri = uri
+        self.rtt = None
+        self.calls = 0
+        self.failures = 0
+        # seconds added to the score per (recent) connection error
+        self.error_penalty = error_penalty
+        self.error_half_life = error_half_life
+        self._errors = 0.0
+        self._last_error = 0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def errors(self, now=None):
+        if not self._errors:
+            return 0.0
+        age = (now or time.time()) - self._last_error
+        return self._errors * 0.5 ** (age / self.error_half_life)
+
+    def record(self, elapsed):
+        with self._lock:
+            self.calls += 1
+            self._samples.append(elapsed)
+            if self.rtt is None:
+                self.rtt = elapsed
+            else:
+                self.rtt = 0.8 * self.rtt + 0.2 * elapsed
+
+    def record_error(self):
+        with self._lock:
+            now = time.time()
+            self.failures += 1
+            self._errors = self.errors(now) + 1
+            self._last_error = now
+
+    def score(self):
+        # endpoints without samples score 0, so each one gets probed
+        return (self.rtt or 0.0) + self.errors() * self.error_penalty
+
+    def percentile(self, fraction, min_samples=10):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+    def stats(self):
+        return {
+            "uri": self.uri,
+            "rtt": self.rtt,
+            "p95": self.percentile(0.95),
+            "errors": self.errors(),
+            "calls": self.calls,
+            "failures": self.failures}
+
+
+class EndpointPool(object):
+    def __init__(self, uris, **kwargs):
+        if not uris:
+            raise ValueError("EndpointPool needs at least one uri")
+        self.endpoints = [Endpoint(uri, **kwargs) for uri in uris]
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def ranked(self):
+        return sorted(self.endpoints, key=lambda endpoint: endpoint.score())
+
+    def stats(self):
+        return [endpoint.stats() for endpoint in self.endpoints]
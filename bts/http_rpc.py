@@ -25,13 +25,25 @@
 #
 ###############################################################################
 
+import itertools
 import json
+import threading
+import time
+from concurrent import futures
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
 except ImportError:
     raise ImportError("Missing dependency: python-requests")
 
+from bts.codec import default_codec
+from bts.endpoint_pool import EndpointPool
+from bts.single_flight import SingleFlight, call_key
+
+# the HTTP endpoint of a node serves the database api as api 0
+API_NAMES = {0: "database"}
+
 """
 Error Classes
 """
@@ -49,58 +61,316 @@ class RPCConnection(Exception):
     pass
 
 
+def rpc_error(error, request):
+    if 'detail' in error:
+        message = error['detail']
+    else:
+        message = error.get('message')
+    # request is usually the already encoded payload, only encode on demand
+    if isinstance(request, bytes):
+        request = request.decode('utf8')
+    elif not isinstance(request, str):
+        request = json.dumps(request)
+    return RPCError("call %s, error %s" % (message, request))
+
+
 class HTTPRPC(object):
-    def __init__(self, uri="", username="", password=""):
+    def __init__(self, uri="", username="", password="",
+                 pool_connections=10, pool_maxsize=10, pool_block=False,
+                 idle_timeout=60, cache=None, coalesce=True, hedge=False,
+                 codec=None, metrics=None):
         if not uri:
             uri = "https://bitshares.openledger.info/ws"
-        uri = uri.replace("wss://", "https://")
-        self.uri = uri
+        # uri may also be a list of nodes, calls go to the best scoring one
+        # and fail over to the next on connection errors
+        if isinstance(uri, (list, tuple)):
+            uris = [_uri.replace("wss://", "https://") for _uri in uri]
+        else:
+            uris = [uri.replace("wss://", "https://")]
+        self.endpoints = EndpointPool(uris)
+        self.uri = uris[0]
+        # send a duplicate to the second best node once a call takes
+        # longer than the p95 latency of the first one
+        self.hedge = hedge
+        self.hedged = 0
+        self._executor = None
         self.username = ""
         self.password = ""
         self.headers = {'content-type': 'application/json'}
+        self.codec = codec or default_codec
+        # optional bts.metrics.RPCMetrics, None disables instrumentation
+        self.metrics = metrics
+        # pool_connections: how many per-host pools are kept,
+        # pool_maxsize: max keep-alive connections per host,
+        # pool_block: wait for a free connection instead of opening more
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        # drop the pooled connections after idle_timeout seconds unused,
+        # the node closes them on its side anyway
+        self.idle_timeout = idle_timeout
+        self._session = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._last_used = 0
+        self._ids = itertools.count(1)
+        # optional bts.cache.ObjectCache for immutable chain data
+        self.cache = cache
+        # identical calls running at the same time share one request
+        self.single_flight = SingleFlight() if coalesce else None
 
-    def rpcexec(self, payload):
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _acquire_session(self):
+        with self._lock:
+            now = time.time()
+            if self._session is not None and self._in_flight == 0 and \
+                    self.idle_timeout is not None and \
+                    now - self._last_used > self.idle_timeout:
+                self._session.close()
+                self._session = None
+            if self._session is None:
+                self._session = self._new_session()
+            self._in_flight += 1
+            self._last_used = now
+            return self._session
+
+    def _release_session(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._last_used = time.time()
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _post_to(self, endpoint, data):
+        session = self._acquire_session()
+        start = time.time()
         try:
-            response = requests.post(
-                self.uri,
-                data=json.dumps(payload),
+            response = session.post(
+                endpoint.uri,
+                data=data,
                 headers=self.headers,
                 auth=(self.username, self.password))
             if response.status_code == 401:
                 raise UnauthorizedError
-            ret = json.loads(response.text)
-            if 'error' in ret:
-                if 'detail' in ret['error']:
-                    raise RPCError("call %s, error %s" % (
-                        ret['error']['detail'], json.dumps(payload)))
-                else:
-                    raise RPCError("call %s, error %s" % (
-                        ret['error']['message'], json.dumps(payload)))
+            content = response.content
+            ret = self.codec.loads(content)
         except requests.exceptions.RequestException:
+            endpoint.record_error()
             raise RPCConnection("Error connecting. Check hostname and port!")
         except UnauthorizedError:
             raise UnauthorizedError("Invalid login credentials!")
         except ValueError:
             raise ValueError("Client returned invalid format. Expected JSON!")
-        except RPCError as err:
-            raise err
+        finally:
+            self._release_session()
+        endpoint.record(time.time() - start)
+        return ret, len(content)
+
+    def _post_failover(self, endpoints, data):
+        for endpoint in endpoints[:-1]:
+            try:
+                return self._post_to(endpoint, data)
+            except RPCConnection:
+                continue
+        return self._post_to(endpoints[-1], data)
+
+    def _post_hedged(self, endpoints, data):
+        delay = endpoints[0].percentile(0.95)
+        if delay is None:
+            return self._post_failover(endpoints, data)
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=2 * self.pool_maxsize)
+            executor = self._executor
+        first = executor.submit(self._post_to, endpoints[0], data)
+        try:
+            return first.result(timeout=delay)
+        except futures.TimeoutError:
+            pass
+        except RPCConnection:
+            return self._post_failover(endpoints[1:], data)
+        self.hedged += 1
+        pending = set([first, executor.submit(
+            self._post_to, endpoints[1], data)])
+        while pending:
+            done, pending = futures.wait(
+                pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _post(self, data):
+        endpoints = self.endpoints.ranked()
+        if self.hedge and len(endpoints) > 1:
+            return self._post_hedged(endpoints, data)
+        return self._post_failover(endpoints, data)
+
+    def _post_measured(self, api, method, data):
+        start = time.time()
+        try:
+            ret, received = self._post(data)
+        except Exception:
+            self.metrics.record(
+                api, method, time.time() - start, True, len(data))
+            raise
+        self.metrics.record(
+            api, method, time.time() - start, 'error' in ret, len(data),
+            received)
+        return ret, received
+
+    def rpcexec(self, payload):
+        data = self.codec.dumps(payload)
+        if self.metrics is None:
+            ret, received = self._post(data)
+        else:
+            api, method = payload["params"][:2]
+            ret, received = self._post_measured(
+                API_NAMES.get(api, api), method, data)
+        if 'error' in ret:
+            raise rpc_error(ret['error'], data)
         return ret["result"]
 
+    def new_query(self, name, args):
+        return {
+            "method": "call",
+            "params": [0, name, args],
+            "jsonrpc": "2.0",
+            "id": next(self._ids)
+        }
+
+    def fetch(self, name, args):
+        if self.single_flight is None:
+            return self.rpcexec(self.new_query(name, args))
+        return self.single_flight.do(
+            call_key(name, args),
+            lambda: self.rpcexec(self.new_query(name, args)))
+
+    def call(self, name, args):
+        if self.cache is None:
+            return self.fetch(name, args)
+        fetch_args, partial = self.cache.lookup(name, args)
+        reply = None
+        if fetch_args is not None:
+            reply = self.fetch(name, fetch_args)
+        return self.cache.complete(name, args, partial, reply)
+
+    def batch(self, max_size=100, raise_errors=True):
+        return HTTPBatch(self, max_size, raise_errors)
+
     """
     Meta:Map all methods to RPC calls and pass through the arguments and result
     """
     def __getattr__(self, name):
         def method(*args):
-            query = {
-                "method": "call",
-                "params": [0, name, args],
-                "jsonrpc": "2.0",
-                "id": 0
-            }
-            r = self.rpcexec(query)
+            r = self.call(name, args)
             return r
         return method
 
+
+class BatchCall(object):
+    def __init__(self, query):
+        self.query = query
+        self.done = False
+        self.error = None
+        self.value = None
+
+    def set_reply(self, reply):
+        self.done = True
+        if reply is None:
+            self.error = RPCError(
+                "call %s, error no reply in batch" % json.dumps(self.query))
+        elif 'error' in reply:
+            self.error = rpc_error(reply['error'], self.query)
+        else:
+            self.value = reply["result"]
+
+    def result(self):
+        if not self.done:
+            raise RPCError("batch has not been executed yet")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class HTTPBatch(object):
+    """Collect calls and send them as JSON-RPC 2.0 batches.
+
+    Every queued call returns a :class:`BatchCall`, its ``result()`` is
+    available once the batch has been executed, either explicitly or when
+    leaving the ``with`` block::
+
+        with rpc.batch() as batch:
+            blocks = [batch.get_block(num) for num in block_nums]
+        timestamps = [b.result()["timestamp"] for b in blocks]
+    """
+    def __init__(self, rpc, max_size=100, raise_errors=True):
+        self.rpc = rpc
+        self.max_size = max_size
+        self.raise_errors = raise_errors
+        self.calls = []
+
+    def __getattr__(self, name):
+        def method(*args):
+            call = BatchCall(self.rpc.new_query(name, args))
+            self.calls.append(call)
+            return call
+        return method
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        for i in range(0, len(calls), self.max_size):
+            chunk = calls[i:i+self.max_size]
+            data = self.rpc.codec.dumps([call.query for call in chunk])
+            if self.rpc.metrics is None:
+                ret, received = self.rpc._post(data)
+            else:
+                ret, received = self.rpc._post_measured(
+                    "database", "batch", data)
+            if isinstance(ret, dict):
+                # the node refused the whole batch
+                raise rpc_error(ret.get('error', {}), data)
+            replies = dict((reply.get("id"), reply) for reply in ret)
+            for call in chunk:
+                call.set_reply(replies.get(call.query["id"]))
+        if self.raise_errors:
+            for call in calls:
+                if call.error is not None:
+                    raise call.error
+        return calls
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.execute()
+
+
 if __name__ == '__main__':
     import sys
     from pprint import pprint
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Decrypt transfer memos sent to one memo key.
+
+Decoding a memo takes an ECDH multiplication for the shared secret of the
+two keys and an AES decryption. The secret only depends on the public key
+of the counterparty, so :class:`MemoDecoder` parses the private key once
+and keeps the secrets of the last ``max_size`` public keys; a memo from a
+known sender then costs a hash and the AES step only.
+
+``decode_many`` decodes a list of memos, in a process pool when given
+one, ``decode_pooled`` is the same for the event loop. Each worker process
+builds its own decoder, and with it its own secret cache, the first time
+it gets a chunk::
+
+    with ProcessPoolExecutor() as executor:
+        texts = decoder.decode_many(memos, executor)
+"""
+
+import hashlib
+from binascii import unhexlify
+from collections import OrderedDict
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+try:
+    from graphenebase import PrivateKey, PublicKey
+    try:
+        from graphenebase import memo as Memo
+    except ImportError:
+        from graphenebase import Memo
+except ImportError:
+    print("[warnning] need python-graphinelib to decode memos")
+
+# decoders of the worker processes, by memo key and prefix
+_decoders = {}
+
+
+def decode_chunk(memo_key, prefix, memos):
+    key = (memo_key, prefix)
+    if key not in _decoders:
+        _decoders[key] = MemoDecoder(memo_key, prefix)
+    return _decoders[key].decode_all(memos)
+
+
+def unpad(message):
+    count = message[-1] if message else 0
+    if 0 < count <= 16 and message[-count:] == bytes([count]) * count:
+        return message[:-count]
+    return message
+
+
+class MemoDecoder(object):
+    def __init__(self, memo_key, prefix="BTS", max_size=1000):
+        self.memo_key = memo_key
+        self.prefix = prefix
+        self.max_size = max_size
+        self.private_key = PrivateKey(memo_key)
+        self.stats = {"hits": 0, "misses": 0, "failures": 0}
+        self._secrets = OrderedDict()
+
+    def shared_secret(self, public_key):
+        if public_key in self._secrets:
+            self._secrets.move_to_end(public_key)
+            self.stats["hits"] += 1
+            return self._secrets[public_key]
+        self.stats["misses"] += 1
+        secret = Memo.get_shared_secret(
+            self.private_key, PublicKey(public_key, prefix=self.prefix))
+        self._secrets[public_key] = secret
+        while len(self._secrets) > self.max_size:
+            self._secrets.popitem(last=False)
+        return secret
+
+    def decode(self, public_key, nonce, message):
+        """Text of ``message``, raises ValueError if it does not decode."""
+        aes = Memo.init_aes(self.shared_secret(public_key), nonce)
+        cleartext = aes.decrypt(unhexlify(message))
+        text = unpad(cleartext[4:])
+        if hashlib.sha256(text).digest()[0:4] != cleartext[0:4]:
+            raise ValueError("checksum verification failure")
+        return text.decode("utf8")
+
+    def decode_memo(self, memo, account_id, to_id):
+        """Decode the memo of a transfer to or from ``account_id``."""
+        return self.decode(*self.memo_args(memo, account_id, to_id))
+
+    def decode_all(self, memos):
+        """Texts of ``(public_key, nonce, message)`` tuples, None for
+        those that do not decode."""
+        texts = []
+        for public_key, nonce, message in memos:
+            try:
+                texts.append(self.decode(public_key, nonce, message))
+            except Exception:
+                self.stats["failures"] += 1
+                texts.append(None)
+        return texts
+
+    def memo_args(self, memo, account_id, to_id):
+        public_key = memo["from"] if to_id == account_id else memo["to"]
+        return public_key, memo["nonce"], memo["message"]
+
+    def decode_many(self, memos, executor=None, chunk_size=100):
+        """Like :meth:`decode_all`, in chunks spread over ``executor``.
+
+        The texts come back in the order of ``memos``.
+        """
+        memos = list(memos)
+        if executor is None:
+            return self.decode_all(memos)
+        chunks = [memos[i:i+chunk_size]
+                  for i in range(0, len(memos), chunk_size)]
+        texts = []
+        for chunk in executor.map(
+                decode_chunk, [self.memo_key] * len(chunks),
+                [self.prefix] * len(chunks), chunks):
+            texts.extend(chunk)
+        return texts
+
+    async def decode_pooled(self, memos, executor, chunk_size=100):
+        """Like :meth:`decode_many`, without blocking the event loop."""
+        loop = asyncio.get_event_loop()
+        chunks = [memos[i:i+chunk_size]
+                  for i in range(0, len(memos), chunk_size)]
+        results = await asyncio.gather(*[loop.run_in_executor(
+            executor, decode_chunk, self.memo_key, self.prefix, chunk)
+            for chunk in chunks])
+        return [text for chunk in results for text in chunk]
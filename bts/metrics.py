@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Per-method call counters and latency histograms.
+
+Clients record into an :class:`RPCMetrics` only when one is attached, so
+leaving ``metrics`` as None costs a single attribute check per call.
+``snapshot()`` returns plain dicts that exporters can publish as they like.
+The time requests wait for a slot of a request window is kept apart from
+the calls, per lane, see ``queue_delays()``, and so is the time from
+connecting to ready of the websocket connections, see ``ready_times()``.
+"""
+
+import bisect
+import threading
+
+
+def _bucket_bounds(start=0.0005, factor=1.25, limit=120.0):
+    bounds = []
+    bound = start
+    while bound < limit:
+        bounds.append(bound)
+        bound *= factor
+    bounds.append(limit)
+    return bounds
+
+
+class Histogram(object):
+    bounds = _bucket_bounds()
+
+    def __init__(self):
+        # the last bucket collects everything above the highest bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls."""
+        if not self.total:
+            return None
+        rank = fraction * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.total,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99)}
+
+
+class MethodStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = Histogram()
+
+    def snapshot(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "latency_sum": self.latency.sum,
+            "latency_max": self.latency.max,
+            "p50": self.latency.percentile(0.50),
+            "p95": self.latency.percentile(0.95),
+            "p99": self.latency.percentile(0.99)}
+
+
+class RPCMetrics(object):
+    def __init__(self):
+        self._stats = {}
+        self._queue_delays = {}
+        self._ready = Histogram()
+        self._lock = threading.Lock()
+
+    def record(self, api, method, elapsed, error=False, sent=0, received=0):
+        key = (api, method)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = MethodStats()
+            stats.calls += 1
+            if error:
+                stats.errors += 1
+            stats.bytes_sent += sent
+            stats.bytes_received += received
+            stats.latency.record(elapsed)
+
+    def record_queue_delay(self, lane, elapsed):
+        with self._lock:
+            delays = self._queue_delays.get(lane)
+            if delays is None:
+                delays = self._queue_delays[lane] = Histogram()
+            delays.record(elapsed)
+
+    def record_ready(self, elapsed):
+        with self._lock:
+            self._ready.record(elapsed)
+
+    def snapshot(self):
+        """Return ``{"api.method": {...}}`` for every method seen."""
+        with self._lock:
+            return dict(
+                ("%s.%s" % key, stats.snapshot())
+                for key, stats in self._stats.items())
+
+    def queue_delays(self):
+        """Return ``{lane: {...}}`` for every lane requests waited in."""
+        with self._lock:
+            return dict(
+                (lane, delays.snapshot())
+                for lane, delays in self._queue_delays.items())
+
+    def ready_times(self):
+        """Return the connect-to-ready times of the connections."""
+        with self._lock:
+            return self._ready.snapshot()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._queue_delays = {}
+            self._ready = Histogram()
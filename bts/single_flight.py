@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Coalesce identical calls that are in flight at the same time.
+
+The first caller of a key runs the call, everybody asking for the same key
+before it returns waits for and shares that one result (or exception).
+Results are shared objects, callers must not modify them.
+
+The asyncio variant is :class:`bts.ws.single_flight.AsyncSingleFlight`,
+this module has to stay importable without asyncio.
+"""
+
+import json
+import threading
+
+
+def call_key(method, args):
+    return json.dumps([method, args], sort_keys=True)
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Thread based variant, used by HTTPRPC."""
+    def __init__(self):
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = func()
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.value
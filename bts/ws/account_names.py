@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Names of accounts, looked up in batches.
+
+Account names never change once registered, so :class:`AccountNameResolver`
+keeps the last ``max_size`` of them without expiry. Ids missing from the
+cache are not looked up one by one: every id asked for during one pass of
+the event loop (or within ``window`` seconds) goes into a single
+``get_objects`` request of at most ``max_batch`` ids, and callers waiting
+for the same id share its lookup.
+"""
+
+from collections import OrderedDict
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+
+class AccountNameResolver(object):
+    def __init__(self, node_api, max_size=10000, max_batch=100, window=0):
+        self.node_api = node_api
+        self.max_size = max_size
+        self.max_batch = max_batch
+        self.window = window
+        self.stats = {"hits": 0, "misses": 0, "batches": 0}
+        self._names = OrderedDict()
+        self._waiting = {}
+        self._batch = []
+        self._flush_handle = None
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return float(self.stats["hits"]) / total if total else 0.0
+
+    def get(self, account_id):
+        return self._names.get(account_id)
+
+    def put(self, account_id, name):
+        self._names[account_id] = name
+        self._names.move_to_end(account_id)
+        while len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+
+    async def name(self, account_id):
+        if account_id in self._names:
+            self._names.move_to_end(account_id)
+            self.stats["hits"] += 1
+            return self._names[account_id]
+        self.stats["misses"] += 1
+        future = self._waiting.get(account_id)
+        if future is None:
+            future = self._waiting[account_id] = \
+                asyncio.get_event_loop().create_future()
+            self._batch.append(account_id)
+            if len(self._batch) >= self.max_batch:
+                self.flush()
+            elif self._flush_handle is None:
+                loop = asyncio.get_event_loop()
+                self._flush_handle = loop.call_later(
+                    self.window, self.flush) if self.window else \
+                    loop.call_soon(self.flush)
+        # one caller giving up must not fail the others
+        return await asyncio.shield(future)
+
+    async def names(self, account_ids):
+        return await asyncio.gather(
+            *[self.name(account_id) for account_id in account_ids])
+
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._batch:
+            batch, self._batch = self._batch, []
+            asyncio.ensure_future(self.fetch(batch))
+
+    async def fetch(self, account_ids):
+        self.stats["batches"] += 1
+        try:
+            accounts = await self.node_api.get_objects(account_ids)
+        except Exception as err:
+            for account_id in account_ids:
+                future = self._waiting.pop(account_id)
+                if not future.done():
+                    future.set_exception(err)
+            return
+        for account_id, account in zip(account_ids, accounts):
+            future = self._waiting.pop(account_id)
+            if account is None:
+                error = ValueError("unknown account %s" % account_id)
+                if not future.done():
+                    future.set_exception(error)
+                continue
+            self.put(account_id, account["name"])
+            if not future.done():
+                future.set_result(account["name"])
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Monitor state of many accounts, one table row per account.
+
+Object ids are stored as their instance numbers in typed arrays, which
+keeps a row at a few dozen bytes instead of a dict of id strings per
+account. -1 marks a value that is not known yet.
+"""
+
+from array import array
+
+STATE_COLUMNS = (
+    "ids", "statistics", "last_trx", "last_op", "last_seq", "target",
+    "head_trx")
+
+
+def id_to_int(id):
+    return int(id.split('.')[-1])
+
+
+class AccountTable(object):
+    def __init__(self):
+        self.names = []
+        self.rows = {}
+        # statistics instance number to row
+        self.by_statistics = {}
+        # account and 2.6 statistics object
+        self.ids = array("q")
+        self.statistics = array("q")
+        # 2.9 history entry, 1.11 operation and history sequence of the
+        # last processed operation
+        self.last_trx = array("q")
+        self.last_op = array("q")
+        self.last_seq = array("q")
+        # total_ops and most_recent_op of the latest statistics notice
+        self.target = array("q")
+        self.head_trx = array("q")
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    def add(self, name):
+        if name in self.rows:
+            return self.rows[name]
+        row = self.rows[name] = len(self.names)
+        self.names.append(name)
+        for column in STATE_COLUMNS:
+            getattr(self, column).append(-1)
+        self.last_op[row] = 0
+        return row
+
+    def set_account(self, row, account_id, statistics_id):
+        self.ids[row] = id_to_int(account_id)
+        self.statistics[row] = id_to_int(statistics_id)
+        self.by_statistics[self.statistics[row]] = row
+
+    def account(self, row):
+        return {
+            "name": self.names[row],
+            "id": "1.2.%d" % self.ids[row] if self.ids[row] >= 0 else "",
+            "statistics": "2.6.%d" % self.statistics[row]
+            if self.statistics[row] >= 0 else ""}
+
+    def state(self, row):
+        """Checkpoint state of ``row``."""
+        return {
+            "last_trx": "2.9.%d" % self.last_trx[row]
+            if self.last_trx[row] >= 0 else "",
+            "last_op": "1.11.%d" % self.last_op[row],
+            "last_seq": self.last_seq[row]
+            if self.last_seq[row] >= 0 else None}
+
+    def load(self, row, state):
+        self.last_trx[row] = id_to_int(state["last_trx"]) \
+            if state["last_trx"] else -1
+        self.last_op[row] = id_to_int(state["last_op"])
+        self.last_seq[row] = state["last_seq"] \
+            if state["last_seq"] is not None else -1
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Asset metadata shared by the protocols of a process.
+
+:class:`AssetRegistry` indexes assets by id and by symbol and keeps the
+precision scale factor (``10 ** precision``) with each of them, so an
+amount is converted with a single division. ``preload`` reads every asset
+in pages with ``list_assets``, a snapshot file gives a warm start without
+the preload and is written again by ``save``. Assets missing from the
+registry are fetched one by one, with ``get_objects`` by id or with
+``lookup_asset_symbols`` by symbol.
+
+``update`` takes asset (1.3.x) and dynamic asset data (2.3.x) notices, so
+the registry follows changes without polling. The node only sends notices
+of objects the connection fetched: the assets looked up are fetched with
+their dynamic data, those of one pass of the event loop together, and
+``subscribe`` fetches all of them again in pages of ``page_size`` on every
+new connection. Changes are written to the snapshot at most every
+``save_interval`` seconds, and by ``flush``.
+"""
+
+import json
+import os
+import time
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from bts.ws.single_flight import AsyncSingleFlight
+
+
+class AssetRegistry(object):
+    def __init__(self, node_api=None, snapshot_path=None, page_size=100,
+                 save_interval=60.0):
+        self.node_api = node_api
+        self.snapshot_path = snapshot_path
+        self.page_size = page_size
+        self.save_interval = save_interval
+        self.loaded = False
+        self.dirty = False
+        self._last_save = time.time()
+        self.by_id = {}
+        self.by_symbol = {}
+        self._by_dynamic = {}
+        self.single_flight = AsyncSingleFlight()
+        # ids of the assets looked up, only those are subscribed to
+        self.used = set()
+        self._unsubscribed = []
+        self._subscribe_handle = None
+        if snapshot_path:
+            self.load()
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, key):
+        return key in self.by_id or key in self.by_symbol
+
+    def get(self, key):
+        """Asset by id or symbol, None when it is not known yet."""
+        return self.by_id.get(key) or self.by_symbol.get(key)
+
+    def add(self, asset):
+        old = self.by_id.get(asset["id"])
+        info = dict(old or {})
+        info.update(asset)
+        info["scale"] = float(10 ** int(info["precision"]))
+        if old is not None and old["symbol"] != info["symbol"]:
+            del self.by_symbol[old["symbol"]]
+        self.by_id[info["id"]] = self.by_symbol[info["symbol"]] = info
+        if "dynamic_asset_data_id" in info:
+            self._by_dynamic[info["dynamic_asset_data_id"]] = info["id"]
+        return info
+
+    def update(self, notice):
+        if notice["id"].startswith("1.3."):
+            self.add(notice)
+        elif notice["id"] in self._by_dynamic:
+            info = self.by_id[self._by_dynamic[notice["id"]]]
+            info["dynamic"] = notice
+        else:
+            return
+        if self.snapshot_path:
+            self.dirty = True
+            if time.time() - self._last_save >= self.save_interval:
+                self.save()
+
+    async def preload(self):
+        lower_bound = ""
+        while True:
+            assets = await self.node_api.list_assets(
+                lower_bound, self.page_size)
+            for asset in assets:
+                self.add(asset)
+            if len(assets) < self.page_size:
+                break
+            # the bound is inclusive, the next page repeats the last asset
+            lower_bound = assets[-1]["symbol"]
+        self.loaded = True
+        if self.snapshot_path:
+            self.save()
+
+    async def subscribe(self, asset_ids=None):
+        """Fetch the assets looked up and their dynamic data, which
+        subscribes the connection to their notices."""
+        if asset_ids is None:
+            asset_ids = self.used
+        ids = []
+        for asset_id in sorted(asset_ids):
+            ids.append(asset_id)
+            if "dynamic_asset_data_id" in self.by_id[asset_id]:
+                ids.append(self.by_id[asset_id]["dynamic_asset_data_id"])
+        pages = await asyncio.gather(
+            *[self.node_api.get_objects(ids[i:i+self.page_size])
+              for i in range(0, len(ids), self.page_size)])
+        for page in pages:
+            for obj in page:
+                if obj is not None:
+                    self.update(obj)
+
+    async def fetch(self, key):
+        if key.startswith("1.3."):
+            asset = (await self.node_api.get_objects([key]))[0]
+        else:
+            asset = (await self.node_api.lookup_asset_symbols([key]))[0]
+        if asset is None:
+            raise ValueError("unknown asset %s" % key)
+        return self.add(asset)
+
+    async def lookup(self, key):
+        info = self.get(key)
+        if info is None:
+            info = await self.single_flight.do(key, lambda: self.fetch(key))
+        self.use(info["id"])
+        return info
+
+    def use(self, asset_id):
+        if asset_id in self.used:
+            return
+        self.used.add(asset_id)
+        self._unsubscribed.append(asset_id)
+        if self._subscribe_handle is None:
+            self._subscribe_handle = asyncio.get_event_loop().call_soon(
+                self.subscribe_used)
+
+    def subscribe_used(self):
+        self._subscribe_handle = None
+        asset_ids, self._unsubscribed = self._unsubscribed, []
+        asyncio.ensure_future(self._subscribe(asset_ids))
+
+    async def _subscribe(self, asset_ids):
+        try:
+            await self.subscribe(asset_ids)
+        except Exception as err:
+            # the next connection subscribes to them again
+            print("subscribing to assets failed: %r" % err)
+
+    def load(self):
+        try:
+            with open(self.snapshot_path) as f:
+                assets = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        for asset in assets:
+            self.add(asset)
+        self.loaded = bool(assets)
+
+    def flush(self):
+        if self.dirty:
+            self.save()
+
+    def save(self):
+        tmp = "%s.tmp" % self.snapshot_path
+        with open(tmp, "w") as f:
+            json.dump(sorted(self.by_id.values(), key=lambda a: a["id"]), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        self.dirty = False
+        self._last_save = time.time()
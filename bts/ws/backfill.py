@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Fetch the full history of an account with many requests in flight.
+
+The sequence numbers of the account history are split into ranges of
+``page_size`` operations. Up to ``parallelism`` ranges are fetched at the
+same time on the bulk lane of the protocol, each fetched page is decoded
+in ``executor`` (a thread or process pool, inline without one) and the
+pages are handed to ``handler`` strictly oldest first::
+
+    backfill = Backfill(protocol, "1.2.100", handler, parallelism=8)
+    await backfill.run()
+
+``decode`` must be picklable, a module level function, to run in a
+process pool. ``handler`` may be a plain function or a coroutine function
+and gets one decoded operation at a time. ``prepare``, a coroutine
+function, gets every page as soon as it is fetched, while the pages before
+it may still be handled.
+"""
+
+import time
+from collections import deque
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+
+def decode_page(decode, ops):
+    return [decode(operation) for operation in ops]
+
+
+class Backfill(object):
+    def __init__(self, protocol, account_id, handler, parallelism=4,
+                 page_size=100, decode=None, executor=None, prepare=None):
+        self.protocol = protocol
+        self.account_id = account_id
+        self.handler = handler
+        self.parallelism = parallelism
+        self.page_size = page_size
+        self.decode = decode
+        self.executor = executor
+        self.prepare = prepare
+        self.stats = {"pages": 0, "operations": 0, "elapsed": 0.0}
+
+    async def total_ops(self):
+        account = (await self.protocol.node_api.get_objects(
+            [self.account_id]))[0]
+        statistics = (await self.protocol.node_api.get_objects(
+            [account["statistics"]]))[0]
+        return statistics["total_ops"]
+
+    def ranges(self, first, last):
+        return [(stop, min(stop + self.page_size - 1, last))
+                for stop in range(first, last + 1, self.page_size)]
+
+    async def fetch(self, stop, start):
+        protocol = self.protocol
+        ops = await protocol.rpc(
+            [protocol.history_api, "get_relative_account_history",
+             [self.account_id, stop, start - stop + 1, start]],
+            priority="bulk")
+        ops = ops[::-1]
+        if self.prepare is not None:
+            await self.prepare(ops)
+        if self.decode is None:
+            return ops
+        if self.executor is None:
+            return decode_page(self.decode, ops)
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor, decode_page, self.decode, ops)
+
+    async def run(self, first=1, last=None):
+        """Hand over the operations with sequence ``first`` to ``last``."""
+        started = time.time()
+        if last is None:
+            last = await self.total_ops()
+        ranges = iter(self.ranges(first, last))
+        # pages are awaited in order, the ones behind keep loading
+        pending = deque()
+
+        def fetch_next():
+            for stop, start in ranges:
+                pending.append(asyncio.ensure_future(self.fetch(stop, start)))
+                return
+        for i in range(self.parallelism):
+            fetch_next()
+        try:
+            while pending:
+                ops = await pending.popleft()
+                fetch_next()
+                self.stats["pages"] += 1
+                for operation in ops:
+                    ret = self.handler(operation)
+                    if asyncio.iscoroutine(ret):
+                        await ret
+                    self.stats["operations"] += 1
+        finally:
+            for task in pending:
+                task.cancel()
+            self.stats["elapsed"] += time.time() - started
+        return self.stats["operations"]
@@ -26,9 +26,19 @@
 ###############################################################################
 
 # from pprint import pprint
-import json
+import inspect
+import random
+import time
+import traceback
 import websockets
 
+from bts.codec import default_codec
+from bts.single_flight import call_key
+from bts.ws.node_api import NodeAPI
+from bts.ws.single_flight import AsyncSingleFlight
+from bts.ws.subscriptions import SubscriptionIndex
+from bts.ws.window import RequestWindow
+
 try:
     import asyncio
 except ImportError:
@@ -39,8 +49,32 @@ class RPCError(Exception):
     pass
 
 
+class RPCConnection(Exception):
+    pass
+
+
+class RPCTimeout(RPCError):
+    pass
+
+
+# request ids wrap around below this
+MAX_REQUEST_ID = 2**31
+
+
+# protocol attributes holding the api ids, by api name
+API_ATTRIBUTES = {
+    "database": "database_api",
+    "history": "history_api",
+    "network_broadcast": "network_api"}
+
+
 class BaseProtocol(object):
-    def __init__(self, uri=""):
+    def __init__(self, uri="", cache=None, coalesce=True, codec=None,
+                 metrics=None, dispatcher=None, reconnect=True,
+                 reconnect_delay=0.5, max_reconnect_delay=30, replay=False,
+                 apis=("database", "history", "network_broadcast"),
+                 api_ids=None, timeout=None, max_in_flight=None,
+                 max_bulk=None, objects=None):
         if not uri:
             uri = "wss://bitshares.openledger.info/ws"
         self.uri = uri
@@ -49,17 +83,157 @@ class BaseProtocol(object):
         self.network_api = 0
         self.database_api = 0
         self.result = {}
-        self.callbacks = {}
+        self.requests = {}
+        self.callbacks = SubscriptionIndex()
+        self.codec = codec or default_codec
+        self.recv_bytes = False
+        # optional bts.metrics.RPCMetrics, None disables instrumentation
+        self.metrics = metrics
+        self.api_names = {1: "login"}
+        # optional bts.ws.dispatcher.NotificationDispatcher, without one
+        # callbacks run inside onMessage
+        self.dispatcher = dispatcher
+        # awaitable database/history calls over this connection
+        self.node_api = NodeAPI(self)
+        # optional bts.cache.ObjectCache for immutable chain data
+        self.cache = cache
+        # optional bts.ws.object_store.ObjectStore, answers get_objects
+        # with the objects the node keeps pushing to us
+        self.objects = objects
+        # identical calls running at the same time share one request
+        self.single_flight = AsyncSingleFlight() if coalesce else None
+        # reconnect with jittered exponential backoff when the socket
+        # drops; requests still waiting for a reply then either fail with
+        # RPCConnection or, with replay, are sent again once reconnected
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.replay = replay
+        self.websocket = None
+        self.connections = 0
+        self.closing = False
+        # apis to look up while opening the connection, api_ids holds
+        # ids known in advance which are used without a lookup
+        self.apis = apis
+        self.api_ids = dict(api_ids or {})
+        for name, api_id in self.api_ids.items():
+            setattr(self, API_ATTRIBUTES[name], api_id)
+            self.api_names[api_id] = name
+        # set once the handshake of the current connection is done,
+        # ready_time is the connect-to-ready time of that connection
+        self.ready = asyncio.Event()
+        self.ready_time = None
+        self.connect_started = None
+        # default deadline of a request in seconds, None waits forever
+        self.timeout = timeout
+        # with max_in_flight, further requests queue for a free slot by
+        # priority, max_bulk caps the requests in flight on the bulk lane
+        self.window = None
+        if max_in_flight or max_bulk:
+            self.window = RequestWindow(max_in_flight, max_bulk)
+
+    async def rpc(self, params, timeout=None, priority="normal",
+                  windowed=True):
+        """Call the node, ``timeout`` overrides the default deadline.
+
+        ``priority`` is the lane of the request, one of "realtime",
+        "normal" and "bulk". Coalesced calls share the deadline and lane
+        of the first caller. Requests of the handshake pass ``windowed``
+        False, they must not wait behind requests queued for it.
+        """
+        if self.objects is not None and params[1] == "get_objects":
+            api, method, args = params
+            fetch_args, partial = self.objects.lookup(method, args)
+            reply = None
+            if fetch_args is not None:
+                reply = await self.read(
+                    [api, method, fetch_args], timeout, priority, windowed)
+            return self.objects.complete(method, args, partial, reply)
+        return await self.read(params, timeout, priority, windowed)
+
+    async def read(self, params, timeout=None, priority="normal",
+                   windowed=True):
+        if self.cache is None:
+            return await self.fetch(params, timeout, priority, windowed)
+        api, method, args = params
+        fetch_args, partial = self.cache.lookup(method, args)
+        reply = None
+        if fetch_args is not None:
+            reply = await self.fetch(
+                [api, method, fetch_args], timeout, priority, windowed)
+        return self.cache.complete(method, args, partial, reply)
+
+    async def fetch(self, params, timeout=None, priority="normal",
+                    windowed=True):
+        if self.single_flight is None:
+            return await self.rpcexec(params, timeout, priority, windowed)
+        return await self.single_flight.do(
+            call_key(params[1], params),
+            lambda: self.rpcexec(params, timeout, priority, windowed))
 
-    async def rpc(self, params):
-        request_id = self.request_id
-        self.request_id += 1
+    def next_request_id(self):
+        # skip ids of requests still waiting after a wrap around
+        while True:
+            request_id = self.request_id
+            self.request_id = (request_id + 1) % MAX_REQUEST_ID
+            if request_id not in self.result:
+                return request_id
+
+    async def rpcexec(self, params, timeout=None, priority="normal",
+                      windowed=True):
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is None:
+            return await self.execute(params, priority, windowed)
+        start = time.time()
+        try:
+            return await asyncio.wait_for(
+                self.execute(params, priority, windowed), timeout)
+        except asyncio.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.record(
+                    self.api_names.get(params[0], params[0]), params[1],
+                    time.time() - start, True)
+            raise RPCTimeout("%s timed out after %ss" % (params[1], timeout))
+
+    async def execute(self, params, priority="normal", windowed=True):
+        window = self.window if windowed else None
+        if window is not None:
+            start = time.time()
+            await window.acquire(priority)
+            if self.metrics is not None:
+                self.metrics.record_queue_delay(
+                    priority, time.time() - start)
+        try:
+            return await self.send_request(params)
+        finally:
+            if window is not None:
+                window.release(priority)
+
+    async def send_request(self, params):
+        request_id = self.next_request_id()
         request = {"id": request_id, "method": "call", "params": params}
         future = self.result[request_id] = asyncio.Future()
-        await self.websocket.send(json.dumps(request).encode('utf8'))
-        await asyncio.wait_for(future, None)
-        self.result.pop(request_id)
-        ret = future.result()
+        self.requests[request_id] = params
+        data = self.codec.dumps(request)
+        start = time.time()
+        try:
+            try:
+                await self.websocket.send(data)
+            except websockets.exceptions.ConnectionClosed:
+                # with replay the request goes out again after reconnecting
+                if not self.replay:
+                    raise RPCConnection("connection lost")
+            await future
+        finally:
+            # also on timeout or cancel, a late reply is then ignored
+            self.result.pop(request_id, None)
+            self.requests.pop(request_id, None)
+        ret, received = future.result()
+        if self.metrics is not None:
+            self.metrics.record(
+                self.api_names.get(params[0], params[0]), params[1],
+                time.time() - start, 'error' in ret, len(data), received)
         if 'error' in ret:
             if 'detail' in ret['error']:
                 raise RPCError(ret['error']['detail'])
@@ -68,50 +242,211 @@ class BaseProtocol(object):
         return ret["result"]
 
     def subscribe(self, object_id, callback):
-        if object_id not in self.callbacks:
-            self.callbacks[object_id] = [callback]
-        else:
-            self.callbacks[object_id].append(callback)
+        # onOpen runs again on every reconnect, don't register twice
+        if object_id in self.callbacks and \
+                callback in self.callbacks[object_id]:
+            return
+        self.callbacks.add(object_id, callback)
+
+    def unsubscribe(self, object_id, callback=None):
+        self.callbacks.remove(object_id, callback)
 
     async def handler_message(self):
         while True:
-            payload = await self.websocket.recv()
+            if self.recv_bytes:
+                payload = await self.websocket.recv(decode=False)
+            else:
+                payload = await self.websocket.recv()
             self.onMessage(payload)
+            if self.dispatcher is not None:
+                await self.dispatcher.wait_ready()
 
-    async def onOpen(self):
-        await self.rpc([1, "login", ["", ""]])
-        self.database_api = await self.rpc([1, "database", []])
-        self.history_api = await self.rpc([1, "history", []])
-        self.network_api = await self.rpc([1, "network_broadcast", []])
+    async def lookup_apis(self, *requests):
+        """Login and look up the api ids, ``requests`` are sent along."""
+        names = [name for name in self.apis if name not in self.api_ids]
+        # the node answers the requests of a connection in order, so login
+        # and the api lookups can all be in flight at once
+        lookups = [self.rpc([1, name, []], windowed=False) for name in names]
+        results = await asyncio.gather(
+            self.rpc([1, "login", ["", ""]], windowed=False),
+            *(lookups + list(requests)))
+        for name, api_id in zip(names, results[1:]):
+            setattr(self, API_ATTRIBUTES[name], api_id)
+            self.api_names[api_id] = name
+
+    async def set_subscribe_callback(self):
         await self.rpc(
-            [self.database_api, "set_subscribe_callback", [200, False]])
+            [self.database_api, "set_subscribe_callback", [200, False]],
+            windowed=False)
 
-    async def handler(self):
+    async def onOpen(self):
+        if "database" in self.api_ids:
+            await self.lookup_apis(self.set_subscribe_callback())
+        else:
+            await self.lookup_apis()
+            await self.set_subscribe_callback()
+
+    async def restore_subscriptions(self):
+        # the node subscribes us to every object we fetch after
+        # set_subscribe_callback, so fetching them again restores them
+        object_ids = [
+            _id for _id in self.callbacks
+            if _id.count(".") == 2 and not _id.endswith(".")]
+        for i in range(0, len(object_ids), 100):
+            await self.rpc(
+                [self.database_api, "get_objects", [object_ids[i:i+100]]],
+                windowed=False)
+
+    def fail_pending(self, error):
+        for request_id, future in list(self.result.items()):
+            if not future.done():
+                future.set_exception(error)
+
+    async def replay_pending(self, request_ids, old_names):
+        for request_id in request_ids:
+            params = self.requests.get(request_id)
+            if params is None:
+                continue
+            api = old_names.get(params[0])
+            if api in API_ATTRIBUTES:
+                params[0] = getattr(self, API_ATTRIBUTES[api])
+            request = {"id": request_id, "method": "call", "params": params}
+            await self.websocket.send(self.codec.dumps(request))
+
+    async def open_connection(self):
+        old_names = dict(self.api_names)
+        pending = set(self.requests)
+        await self.onOpen()
+        if self.connections > 1:
+            await self.restore_subscriptions()
+            await self.replay_pending(sorted(pending), old_names)
+        self.ready_time = time.time() - self.connect_started
+        if self.metrics is not None:
+            self.metrics.record_ready(self.ready_time)
+        self.ready.set()
+
+    async def connect(self):
+        self.connect_started = time.time()
         # can handle message less than 8M
         async with websockets.connect(
                 self.uri, max_size=2**20*8, max_queue=2**5*2) as websocket:
             print("WebSocket connection open.")
             self.websocket = websocket
+            if self.closing:
+                return
+            self.connections += 1
+            # newer websockets can hand over frames undecoded, the codec
+            # parses bytes directly
+            self.recv_bytes = "decode" in inspect.signature(
+                websocket.recv).parameters
+            if self.dispatcher is not None:
+                self.dispatcher.start()
             task1 = asyncio.ensure_future(self.handler_message())
-            task2 = asyncio.ensure_future(self.onOpen())
-            await asyncio.wait([task1, task2])
+            task2 = asyncio.ensure_future(self.open_connection())
+            try:
+                await asyncio.wait(
+                    [task1, task2], return_when=asyncio.FIRST_EXCEPTION)
+                if task2.done() and not task2.cancelled() and \
+                        task2.exception() is not None:
+                    print("Opening the connection failed: %r" %
+                          task2.exception())
+                    # ends the message loop, handler backs off and retries
+                    await websocket.close()
+                await task1
+            finally:
+                task1.cancel()
+                task2.cancel()
+
+    async def handler(self):
+        try:
+            await self.run_connections()
+        finally:
+            # the workers would outlive the protocol otherwise
+            if self.dispatcher is not None:
+                await self.dispatcher.stop()
+
+    async def run_connections(self):
+        delay = self.reconnect_delay
+        while not self.closing:
+            started = time.time()
+            supervised = False
+            try:
+                await self.connect()
+                supervised = True
+            except (OSError, asyncio.TimeoutError,
+                    websockets.exceptions.WebSocketException) as err:
+                print("WebSocket connection lost: %r" % err)
+                supervised = True
+            finally:
+                self.ready.clear()
+                if self.objects is not None:
+                    self.objects.clear()
+                # nothing answers the pending requests once we leave
+                if not supervised or not self.replay or \
+                        not self.reconnect or self.closing:
+                    self.fail_pending(RPCConnection("connection lost"))
+            if not self.reconnect or self.closing:
+                return
+            if time.time() - started > self.max_reconnect_delay:
+                # the connection was up for a while, start over
+                delay = self.reconnect_delay
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def close(self):
+        self.closing = True
+        if self.websocket is not None:
+            try:
+                await self.websocket.close()
+            except websockets.exceptions.WebSocketException:
+                pass
 
     def onMessage(self, payload):
-        res = json.loads(payload)
+        # a bad frame or callback must not end the message loop
+        try:
+            res = self.codec.loads(payload)
+        except Exception:
+            traceback.print_exc()
+            return
         if "id" in res and res["id"] in self.result:
-            self.result[res["id"]].set_result(res)
+            future = self.result[res["id"]]
+            if not future.done():
+                future.set_result((res, len(payload)))
         elif "method" in res:
             for notice in res["params"][1][0]:
-                if "id" not in notice:
-                    # means the object have removed from chain
-                    if "removed" in self.callbacks:
-                        for _cb in self.callbacks["removed"]:
-                            _cb(notice)
-                    continue
-                for _id in self.callbacks:
-                    if _id == notice["id"][:len(_id)]:
-                        for _cb in self.callbacks[_id]:
-                            _cb(notice)
+                self.onNotice(notice)
+
+    def onNotice(self, notice):
+        if self.objects is not None:
+            self.objects.apply(notice)
+        if "id" not in notice:
+            # means the object have removed from chain
+            if "removed" in self.callbacks:
+                key = notice if isinstance(notice, str) else "removed"
+                self.dispatch(key, self.callbacks["removed"], notice)
+            return
+        if self.cache is not None and notice["id"] == "2.1.0":
+            self.cache.update_global_properties(notice)
+        callbacks = self.callbacks.match(notice["id"])
+        if callbacks:
+            self.dispatch(notice["id"], callbacks, notice)
+
+    def dispatch(self, key, callbacks, notice):
+        if self.dispatcher is not None:
+            self.dispatcher.submit(key, callbacks, notice)
+            return
+        for _cb in callbacks:
+            try:
+                self.run_callback(_cb, notice)
+            except Exception:
+                traceback.print_exc()
+
+    def run_callback(self, callback, notice):
+        # coroutine callbacks run as tasks, so they can await rpc calls
+        # without holding up the message loop
+        ret = callback(notice)
+        if asyncio.iscoroutine(ret):
+            asyncio.ensure_future(ret)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Timestamps of blocks without downloading the blocks.
+
+:class:`BlockTimeResolver` keeps the timestamps of the last ``max_size``
+blocks it has seen. A miss fetches only the block header, and
+simultaneous misses for the same block share one request. Every dynamic
+global properties object (2.1.0) handed to
+:meth:`~BlockTimeResolver.update_global_properties` adds the exact time
+of the head block, so a monitor subscribed to 2.1.0 usually knows the
+time of new blocks before their operations come in.
+
+With ``estimate`` enabled, a block at most ``max_estimate`` blocks below
+the head is given ``head time - distance * block_interval`` and no
+request is made. That is exact unless block producers missed slots in
+between, which makes the estimate early by a multiple of the interval.
+"""
+
+import calendar
+import time
+from collections import OrderedDict
+
+from bts.ws.single_flight import AsyncSingleFlight
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def parse_time(timestamp):
+    return calendar.timegm(time.strptime(timestamp, TIME_FORMAT))
+
+
+def format_time(seconds):
+    return time.strftime(TIME_FORMAT, time.gmtime(seconds))
+
+
+class BlockTimeResolver(object):
+    def __init__(self, node_api, max_size=10000, block_interval=3,
+                 estimate=False, max_estimate=1000):
+        self.node_api = node_api
+        self.max_size = max_size
+        self.block_interval = block_interval
+        self.estimate = estimate
+        self.max_estimate = max_estimate
+        self.head_block = None
+        self.head_time = None
+        self.stats = {"hits": 0, "misses": 0, "estimated": 0}
+        self.single_flight = AsyncSingleFlight()
+        self._times = OrderedDict()
+
+    def put(self, block_num, timestamp):
+        self._times[block_num] = timestamp
+        self._times.move_to_end(block_num)
+        while len(self._times) > self.max_size:
+            self._times.popitem(last=False)
+
+    def update_global_properties(self, properties):
+        if not properties or "head_block_number" not in properties:
+            return
+        self.head_block = properties["head_block_number"]
+        self.head_time = parse_time(properties["time"])
+        self.put(self.head_block, properties["time"])
+
+    async def fetch(self, block_num):
+        header = await self.node_api.get_block_header(block_num)
+        if header is None:
+            raise ValueError("unknown block %d" % block_num)
+        self.put(block_num, header["timestamp"])
+        return header["timestamp"]
+
+    async def timestamp(self, block_num):
+        if block_num in self._times:
+            self._times.move_to_end(block_num)
+            self.stats["hits"] += 1
+            return self._times[block_num]
+        if self.estimate and self.head_block is not None and \
+                0 <= self.head_block - block_num <= self.max_estimate:
+            self.stats["estimated"] += 1
+            return format_time(
+                self.head_time -
+                (self.head_block - block_num) * self.block_interval)
+        self.stats["misses"] += 1
+        return await self.single_flight.do(
+            block_num, lambda: self.fetch(block_num))
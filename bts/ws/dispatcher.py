@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Run subscription callbacks off the websocket receive loop.
+
+Notices are queued per worker and handled by asyncio worker tasks, so a
+slow callback no longer stops the socket from being read. Notices for
+the same object always go to the same worker and are handled in arrival
+order. Coroutine callbacks are awaited by the worker, plain callbacks run
+in ``executor`` when one is given and inline on the loop otherwise.
+
+When a worker queue is full, ``policy`` decides what happens:
+
+* ``"block"``: the notice is queued anyway and the receive loop waits in
+  :meth:`NotificationDispatcher.wait_ready` until the queues drain, which
+  pushes back on the node through the socket.
+* ``"drop_newest"``: the new notice is dropped.
+* ``"drop_oldest"``: the oldest queued notice of that worker is dropped.
+"""
+
+import traceback
+from collections import deque
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+POLICIES = ("block", "drop_newest", "drop_oldest")
+
+
+class NotificationDispatcher(object):
+    def __init__(self, workers=4, max_queue=1024, policy="block",
+                 executor=None):
+        if policy not in POLICIES:
+            raise ValueError("unknown policy %s, use one of %s" % (
+                policy, ", ".join(POLICIES)))
+        self.workers = workers
+        self.max_queue = max_queue
+        self.policy = policy
+        self.executor = executor
+        self.stats = {
+            "queued": 0, "processed": 0, "dropped": 0, "errors": 0,
+            "high_water": 0}
+        self._queues = [deque() for i in range(workers)]
+        self._wakeup = None
+        self._ready = None
+        self._idle = None
+        self._unfinished = 0
+        self._tasks = []
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wakeup = [asyncio.Event() for i in range(self.workers)]
+        self._ready = asyncio.Event()
+        self._ready.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.ensure_future(self._worker(i))
+                       for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def depth(self):
+        return sum(len(queue) for queue in self._queues)
+
+    def submit(self, key, callbacks, notice):
+        index = hash(key) % self.workers
+        queue = self._queues[index]
+        if len(queue) >= self.max_queue:
+            if self.policy == "drop_newest":
+                self.stats["dropped"] += 1
+                return
+            if self.policy == "drop_oldest":
+                queue.popleft()
+                self.stats["dropped"] += 1
+                self._done()
+            else:
+                self._ready.clear()
+        queue.append((callbacks, notice))
+        self._unfinished += 1
+        self._idle.clear()
+        self.stats["queued"] += 1
+        if len(queue) > self.stats["high_water"]:
+            self.stats["high_water"] = len(queue)
+        self._wakeup[index].set()
+
+    async def wait_ready(self):
+        """Wait until every queue has room again."""
+        await self._ready.wait()
+
+    async def join(self):
+        """Wait until every queued notice has been handled."""
+        await self._idle.wait()
+
+    def _done(self):
+        self._unfinished -= 1
+        if not self._unfinished:
+            self._idle.set()
+
+    async def _run(self, callback, notice):
+        if self.executor is None:
+            ret = callback(notice)
+        else:
+            ret = await asyncio.get_event_loop().run_in_executor(
+                self.executor, callback, notice)
+        if asyncio.iscoroutine(ret):
+            await ret
+
+    async def _worker(self, index):
+        queue = self._queues[index]
+        wakeup = self._wakeup[index]
+        while True:
+            if not queue:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            callbacks, notice = queue.popleft()
+            if not self._ready.is_set() and all(
+                    len(_queue) < self.max_queue for _queue in self._queues):
+                self._ready.set()
+            for callback in callbacks:
+                try:
+                    await self._run(callback, notice)
+                except Exception:
+                    self.stats["errors"] += 1
+                    traceback.print_exc()
+            self.stats["processed"] += 1
+            self._done()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Awaitable node API calls over the websocket of a BaseProtocol.
+
+:class:`NodeAPI` has the same dynamic method proxy as HTTPRPC and
+AsyncHTTPRPC, unknown attributes become database API calls, while
+``history`` and ``network_broadcast`` reach the other APIs::
+
+    block = await protocol.node_api.get_block(num)
+    ops = await protocol.node_api.history.get_account_history(...)
+
+The API ids are read from the protocol at call time, so the proxies keep
+working after onOpen looked them up again. The ``timeout`` and ``priority``
+keywords set the deadline and lane of a single call.
+
+:class:`ExecutorAPI` makes the calls of a blocking client such as HTTPRPC
+awaitable, they run in an executor.
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+
+class APIProxy(object):
+    def __init__(self, protocol, api):
+        self.protocol = protocol
+        # name of the protocol attribute holding the api id
+        self.api = api
+
+    def __getattr__(self, name):
+        async def method(*args, timeout=None, priority="normal"):
+            return await self.protocol.rpc(
+                [getattr(self.protocol, self.api), name, list(args)],
+                timeout, priority)
+        return method
+
+
+class NodeAPI(APIProxy):
+    def __init__(self, protocol):
+        super(NodeAPI, self).__init__(protocol, "database_api")
+        self.database = APIProxy(protocol, "database_api")
+        self.history = APIProxy(protocol, "history_api")
+        self.network_broadcast = APIProxy(protocol, "network_api")
+
+
+class ExecutorAPI(object):
+    def __init__(self, client, executor=None):
+        self.client = client
+        # None is the default executor of the loop
+        self.executor = executor
+
+    def __getattr__(self, name):
+        func = getattr(self.client, name)
+
+        async def method(*args):
+            return await asyncio.get_event_loop().run_in_executor(
+                self.executor, func, *args)
+        return method
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""Local mirror of the chain objects a connection is subscribed to.
+
+After ``set_subscribe_callback`` the node pushes the new state of every
+object we fetched whenever it changes, and the id of every object that is
+removed. :class:`ObjectStore` applies those notices, so an object fetched
+once is answered by ``get_objects`` from memory for as long as the
+connection stays up. Only ids the store does not hold go to the node.
+
+Every object is stored with the head block it was last updated at, known
+from the 2.1.0 notices, see :meth:`~ObjectStore.version`. With
+``max_age`` an object is fetched again once it is more than that many
+blocks old, for objects the node does not push.
+
+Each space ("1.2", "2.9", ...) is a LRU of its own, capped by ``limits``
+or else ``max_per_space``. When all spaces together hold more than
+``max_objects``, the largest space gives up its least recently used
+object.
+"""
+
+from collections import OrderedDict
+
+MISSING = object()
+
+
+def space_of(object_id):
+    return object_id.rsplit(".", 1)[0]
+
+
+class ObjectStore(object):
+    def __init__(self, max_objects=100000, max_per_space=None, limits=None,
+                 max_age=None):
+        self.max_objects = max_objects
+        self.max_per_space = max_per_space
+        self.limits = dict(limits or {})
+        self.max_age = max_age
+        self.head_block = 0
+        self.size = 0
+        self.stats = {"hits": 0, "misses": 0, "updates": 0, "removals": 0,
+                      "evictions": 0}
+        self.spaces = {}
+        # counts every change, a reply must not undo a newer notice
+        self._sequence = 0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, object_id):
+        return self.get(object_id, count=False) is not MISSING
+
+    def version(self, object_id):
+        """Head block the object was last updated at, None if unknown."""
+        entry = self.spaces.get(space_of(object_id), {}).get(object_id)
+        return entry[0] if entry is not None else None
+
+    def get(self, object_id, count=True):
+        space = self.spaces.get(space_of(object_id))
+        entry = space.get(object_id) if space is not None else None
+        if entry is None or (self.max_age is not None and
+                             self.head_block - entry[0] > self.max_age):
+            if count:
+                self.stats["misses"] += 1
+            return MISSING
+        space.move_to_end(object_id)
+        if count:
+            self.stats["hits"] += 1
+        return entry[2]
+
+    def put(self, obj, sequence=None):
+        space_id = space_of(obj["id"])
+        space = self.spaces.get(space_id)
+        if space is None:
+            space = self.spaces[space_id] = OrderedDict()
+        entry = space.get(obj["id"])
+        if entry is None:
+            self.size += 1
+        elif sequence is not None and entry[1] > sequence:
+            return
+        self._sequence += 1
+        space[obj["id"]] = (self.head_block, self._sequence, obj)
+        space.move_to_end(obj["id"])
+        self.evict(space_id)
+
+    def remove(self, object_id):
+        space = self.spaces.get(space_of(object_id))
+        if space is not None and space.pop(object_id, None) is not None:
+            self.size -= 1
+            self.stats["removals"] += 1
+
+    def evict(self, space_id):
+        space = self.spaces[space_id]
+        limit = self.limits.get(space_id, self.max_per_space)
+        while limit is not None and len(space) > limit:
+            space.popitem(last=False)
+            self.size -= 1
+            self.stats["evictions"] += 1
+        while self.max_objects is not None and self.size > self.max_objects:
+            largest = max(self.spaces.values(), key=len)
+            largest.popitem(last=False)
+            self.size -= 1
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        """Forget everything, the notices missed while disconnected
+        would leave the objects stale."""
+        self.spaces = {}
+        self.size = 0
+
+    def apply(self, notice):
+        if isinstance(notice, str):
+            self.remove(notice)
+            return
+        if "id" not in notice:
+            return
+        if notice["id"] == "2.1.0" and "head_block_number" in notice:
+            self.head_block = notice["head_block_number"]
+        self.stats["updates"] += 1
+        self.put(notice)
+
+    def lookup(self, method, args):
+        """Same contract as :meth:`bts.cache.ObjectCache.lookup`, for
+        ``get_objects`` only."""
+        found = {}
+        missing = []
+        for object_id in args[0]:
+            obj = self.get(object_id)
+            if obj is MISSING:
+                missing.append(object_id)
+            else:
+                found[object_id] = obj
+        if not missing:
+            return None, (found, self._sequence)
+        return [missing], (found, self._sequence)
+
+    def complete(self, method, args, partial, reply):
+        found, sequence = partial
+        fetched = iter(reply or [])
+        result = []
+        for object_id in args[0]:
+            if object_id in found:
+                result.append(found[object_id])
+                continue
+            obj = next(fetched)
+            if obj is not None:
+                if object_id == "2.1.0":
+                    self.head_block = max(
+                        self.head_block, obj["head_block_number"])
+                self.put(obj, sequence)
+            result.append(obj)
+        return result
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Resolve items concurrently and deliver them in order.
+
+Items go through three stages: a bounded input queue, ``concurrency``
+workers awaiting ``resolve(item)``, and one task calling
+``deliver(result)`` strictly in the order the items were put, however the
+resolves finish. ``put`` waits while ``max_pending`` items are not
+delivered yet, so a slow consumer holds up the producer instead of
+growing the queues::
+
+    pipeline = OrderedPipeline(resolve, deliver, concurrency=16)
+    for item in items:
+        await pipeline.put(item)
+    await pipeline.join()
+
+When a resolve or deliver fails, nothing after that item is delivered,
+``put`` and ``join`` raise the error and the pipeline has to be closed.
+"""
+
+from collections import deque
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+
+class OrderedPipeline(object):
+    def __init__(self, resolve, deliver, concurrency=16, max_pending=256):
+        self.resolve = resolve
+        self.deliver = deliver
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.stats = {"delivered": 0, "high_water": 0}
+        self.error = None
+        self._queue = deque()
+        self._results = {}
+        self._put = 0
+        self._next = 0
+        self._room = asyncio.Event()
+        self._room.set()
+        self._work = asyncio.Event()
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = []
+        self._deliverer = None
+
+    def pending(self):
+        return self._put - self._next
+
+    async def put(self, item):
+        while self.pending() >= self.max_pending and self.error is None:
+            self._room.clear()
+            await self._room.wait()
+        if self.error is not None:
+            raise self.error
+        self._queue.append((self._put, item))
+        self._put += 1
+        self._idle.clear()
+        if self.pending() > self.stats["high_water"]:
+            self.stats["high_water"] = self.pending()
+        if len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.ensure_future(self._worker()))
+        if self._deliverer is None:
+            self._deliverer = asyncio.ensure_future(self._deliver())
+        self._work.set()
+
+    async def join(self):
+        await self._idle.wait()
+        if self.error is not None:
+            raise self.error
+
+    async def close(self):
+        tasks = self._workers + [self._deliverer]
+        for task in tasks:
+            if task is not None:
+                task.cancel()
+        for task in tasks:
+            if task is not None:
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._workers = []
+        self._deliverer = None
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self._room.set()
+        self._idle.set()
+
+    async def _worker(self):
+        while True:
+            if not self._queue:
+                self._work.clear()
+                await self._work.wait()
+                continue
+            index, item = self._queue.popleft()
+            try:
+                self._results[index] = (await self.resolve(item), None)
+            except Exception as err:
+                self._results[index] = (None, err)
+            if index == self._next:
+                self._ready.set()
+
+    async def _deliver(self):
+        while True:
+            if self._next not in self._results:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            result, error = self._results.pop(self._next)
+            if error is None:
+                try:
+                    ret = self.deliver(result)
+                    if asyncio.iscoroutine(ret):
+                        await ret
+                except Exception as err:
+                    error = err
+            if error is not None:
+                self._fail(error)
+                return
+            self._next += 1
+            self.stats["delivered"] += 1
+            self._room.set()
+            if not self.pending():
+                self._idle.set()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""asyncio variant of :class:`bts.single_flight.SingleFlight`.
+
+Results are shared objects, callers must not modify them.
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+
+class AsyncSingleFlight(object):
+    """``func`` is a coroutine function.
+
+    The shared call is cancelled once every waiter has been cancelled.
+    """
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+        self._waiters = {}
+
+    async def do(self, key, func):
+        future = self._calls.get(key)
+        if future is None:
+            future = self._calls[key] = asyncio.ensure_future(func())
+            self._waiters[future] = 0
+            future.add_done_callback(
+                lambda _future: self._forget(key, _future))
+        else:
+            self.shared += 1
+        self._waiters[future] += 1
+        try:
+            # one waiter being cancelled must not cancel the shared call
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if future in self._waiters:
+                self._waiters[future] -= 1
+                if not self._waiters[future]:
+                    future.cancel()
+            raise
+
+    def _forget(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        self._waiters.pop(future, None)
+        if not future.cancelled():
+            # waiters re-raise the error themselves, if any are left
+            future.exception()
@@ -26,8 +26,17 @@
 ###############################################################################
 
 # from pprint import pprint
+import inspect
+import itertools
+from collections import deque
+
+from bts.ws.accounts import AccountTable
+from bts.ws.assets import AssetRegistry
+from bts.ws.backfill import Backfill
+from bts.ws.block_time import BlockTimeResolver
 from bts.ws.base_protocol import BaseProtocol
-from bts.http_rpc import HTTPRPC
+from bts.ws.node_api import ExecutorAPI
+from bts.ws.pipeline import OrderedPipeline
 
 try:
     import asyncio
@@ -40,51 +49,342 @@ def id_to_int(id):
 
 
 class StatisticsProtocol(BaseProtocol):
-    account = {"name": "exchange.btsbots", "id": "", "statistics": ""}
-    last_trx = ""
-    last_op = "2.9.1"
-    node_api = None
+    """Follow the history of one or many accounts on one connection.
+
+    Statistics notices only record how far an account is behind, history
+    is then caught up by ``catch_up_workers`` tasks taking turns over the
+    accounts, one page of ``page_size`` operations per turn. While a page
+    is processed, the next page of that account and the first pages of the
+    ``prefetch`` accounts next in turn are requested ahead.
+
+    The operations of a page go through an :class:`OrderedPipeline`, up to
+    ``resolve_concurrency`` of them are looked up by resolve_operation at
+    the same time and deliver_operation gets them in order.
+    """
+    page_size = 100
+    prefetch = 2
+    catch_up_workers = 4
+    resolve_concurrency = 16
+    # a failed catch up is retried after retry_delay seconds, doubling up
+    # to max_retry_delay while it keeps failing
+    retry_delay = 1.0
+    max_retry_delay = 60.0
+    # subclasses converting amounts set this, they get an AssetRegistry
+    # of their own unless one is passed in
+    uses_assets = False
+
+    def __init__(self, uri="", checkpoint=None, assets=None, **kwargs):
+        super(StatisticsProtocol, self).__init__(uri, **kwargs)
+        self.accounts = AccountTable()
+        # optional bts.checkpoint store, each account resumes from the
+        # state saved under its name
+        self.checkpoint = checkpoint
+        self._flush_handle = None
+        # rows waiting for their turn, rows waiting or being caught up
+        self.behind = deque()
+        self.scheduled = set()
+        self.pages = {}
+        self.workers = set()
+        self._retry_delays = {}
+        self._retries = {}
+        # timestamps of the blocks operations are in, kept current by
+        # the 2.1.0 notices
+        self.block_time = BlockTimeResolver(self.node_api)
+        # an AssetRegistry may be shared by the protocols of a process
+        if assets is None and self.uses_assets:
+            assets = AssetRegistry()
+        self.assets = assets
+        if assets is not None and assets.node_api is None:
+            assets.node_api = self.node_api
+        self._asset_refresh = None
+
+    # the first account, for monitors of a single account
+    @property
+    def account(self):
+        return self.accounts.account(0)
+
+    @property
+    def last_trx(self):
+        return self.accounts.state(0)["last_trx"]
+
+    @last_trx.setter
+    def last_trx(self, trx_id):
+        self.accounts.last_trx[0] = id_to_int(trx_id) if trx_id else -1
+        self.accounts.last_seq[0] = -1
+
+    @property
+    def last_op(self):
+        return self.accounts.state(0)["last_op"]
+
+    @last_op.setter
+    def last_op(self, op_id):
+        self.accounts.last_op[0] = id_to_int(op_id)
+
+    @property
+    def last_seq(self):
+        return self.accounts.state(0)["last_seq"]
+
+    def init_statistics(self, node_api, account_names):
+        """Monitor ``account_names``, a name or a list of names."""
+        # node_api None means querying over our own websocket
+        if node_api is not None:
+            # blocking clients like HTTPRPC must not stall the loop
+            if not inspect.iscoroutinefunction(node_api.get_objects):
+                node_api = ExecutorAPI(node_api)
+            if self.assets is not None and \
+                    self.assets.node_api is self.node_api:
+                self.assets.node_api = node_api
+            self.node_api = node_api
+            self.block_time.node_api = node_api
+        if isinstance(account_names, str):
+            account_names = [account_names]
+        for name in account_names:
+            row = self.accounts.add(name)
+            if self.checkpoint is not None:
+                state = self.checkpoint.load(name)
+                if state is not None:
+                    self.accounts.load(row, state)
+
+    def save_checkpoint(self, row=0):
+        if self.checkpoint is None:
+            return
+        self.checkpoint.save(
+            self.accounts.names[row], self.accounts.state(row))
+        # whatever the interval left unwritten goes out with a timer
+        if self.checkpoint.dirty() and self._flush_handle is None:
+            self._flush_handle = asyncio.get_event_loop().call_later(
+                self.checkpoint.flush_interval, self.flush_checkpoint)
+
+    def flush_checkpoint(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self.checkpoint is not None:
+            self.checkpoint.flush()
+
+    async def refresh_assets(self):
+        try:
+            if not self.assets.loaded:
+                await self.assets.preload()
+            await self.assets.subscribe()
+        except Exception as err:
+            # unknown assets are still fetched one by one
+            print("refresh of assets failed: %r" % err)
+
+    async def close(self):
+        self.flush_checkpoint()
+        if self.assets is not None:
+            self.assets.flush()
+        if self._asset_refresh is not None:
+            self._asset_refresh.cancel()
+        for handle in self._retries.values():
+            handle.cancel()
+        self._retries = {}
+        await super(StatisticsProtocol, self).close()
+
+    def backfill(self, account_name, **kwargs):
+        """Backfill of the whole history of a monitored account, see
+        :class:`bts.ws.backfill.Backfill` for the keyword arguments."""
+        account = self.accounts.account(self.accounts.rows[account_name])
+        return Backfill(
+            self, account["id"],
+            lambda operation: self.process_operation(operation, account),
+            prepare=lambda ops: self.prepare_page(ops, account), **kwargs)
+
+    async def process_operations(self, op_id):
+        op_info = await self.node_api.get_objects([op_id])
+        for operation in op_info:
+            await self.process_operation(operation, self.account)
 
-    def init_statistics(self, node_api, account_name):
-        self.node_api = node_api
-        self.account["name"] = account_name
+    async def process_operation(self, operation, account):
+        print(operation)
 
-    def process_operations(self, op_id):
-        op_info = self.node_api.get_objects([op_id])
-        print(op_info)
+    async def prepare_page(self, ops, account):
+        """Work on a whole page of operations before they are resolved."""
+        pass
+
+    async def resolve_operation(self, operation, account):
+        """Look up what delivering ``operation`` needs."""
+        return operation
+
+    async def deliver_operation(self, resolved, account):
+        await self.process_operation(resolved, account)
 
     def onStatistics(self, notify):
         # TODO: if network is ont sync, return
-        trx_last = self.last_trx
-        trx_current = notify["most_recent_op"]
-        if id_to_int(trx_current) > id_to_int(trx_last):
-            self.last_trx = trx_current
-        else:
+        table = self.accounts
+        row = table.by_statistics.get(id_to_int(notify["id"]))
+        if row is None:
+            return
+        if notify["total_ops"] >= table.target[row]:
+            table.target[row] = notify["total_ops"]
+            table.head_trx[row] = id_to_int(notify["most_recent_op"])
+        # accounts new to us get their starting point in onOpen first
+        if table.last_trx[row] >= 0 and \
+                table.last_seq[row] < table.target[row]:
+            self.schedule(row)
+
+    def schedule(self, row):
+        if row in self.scheduled:
+            # a worker has it, and sees the new target when done
+            return
+        self.scheduled.add(row)
+        self.behind.append(row)
+        while len(self.workers) < min(
+                self.catch_up_workers, len(self.behind)):
+            worker = asyncio.ensure_future(self.catch_up())
+            self.workers.add(worker)
+            worker.add_done_callback(self.workers.discard)
+
+    async def catch_up(self):
+        table = self.accounts
+        while self.behind:
+            row = self.behind.popleft()
+            try:
+                await self.walk_page(row)
+            except Exception as err:
+                print("catch up of %s failed: %r" % (table.names[row], err))
+                self.drop_pages(row)
+                self.scheduled.discard(row)
+                self.retry_later(row)
+                continue
+            self._retry_delays.pop(row, None)
+            if table.last_seq[row] < table.target[row]:
+                self.behind.append(row)
+            else:
+                self.scheduled.discard(row)
+                table.last_trx[row] = table.head_trx[row]
+                self.save_checkpoint(row)
+
+    def retry_later(self, row):
+        if row in self._retries or self.closing:
+            return
+        delay = self._retry_delays.get(row, self.retry_delay)
+        self._retry_delays[row] = min(delay * 2, self.max_retry_delay)
+        self._retries[row] = asyncio.get_event_loop().call_later(
+            delay, self.retry, row)
+
+    def retry(self, row):
+        del self._retries[row]
+        self.schedule(row)
+
+    def drop_pages(self, row):
+        task = self.pages.pop(row, None)
+        if task is not None:
+            task.cancel()
+
+    async def find_sequence(self, trx_id):
+        trx_info = (await self.node_api.get_objects([trx_id]))[0]
+        if trx_info is None:
+            # pruned from the node, page through whatever is left
+            return 0
+        return trx_info["sequence"]
+
+    async def get_history_page(self, row, stop, start, priority):
+        """Operations with sequence ``stop`` to ``start``, oldest first."""
+        ops = await self.rpc(
+            [self.history_api, "get_relative_account_history",
+             ["1.2.%d" % self.accounts.ids[row], stop, start - stop + 1,
+              start]],
+            priority=priority)
+        return start, ops[::-1]
+
+    def fetch_page(self, row, after):
+        target = self.accounts.target[row]
+        # catching up a long way must not hold up the live lookups
+        priority = "bulk" if target - after > self.page_size else "normal"
+        return asyncio.ensure_future(self.get_history_page(
+            row, after + 1, min(after + self.page_size, target), priority))
+
+    def prefetch_pages(self):
+        table = self.accounts
+        for row in itertools.islice(self.behind, self.prefetch):
+            if row not in self.pages and table.last_seq[row] >= 0:
+                self.pages[row] = self.fetch_page(row, table.last_seq[row])
+
+    async def walk_page(self, row):
+        table = self.accounts
+        if table.last_seq[row] < 0:
+            table.last_seq[row] = await self.find_sequence(
+                "2.9.%d" % table.last_trx[row])
+        if table.last_seq[row] >= table.target[row]:
             return
-        while True:
-            if id_to_int(trx_current) <= id_to_int(trx_last):
-                return
-            trx_info = self.node_api.get_objects([trx_current])[0]
-            if id_to_int(trx_info["operation_id"]) <= id_to_int(self.last_op):
-                return
-            self.process_operations(trx_info["operation_id"])
-            trx_current = trx_info["next"]
-
-    @asyncio.coroutine
-    def onOpen(self):
-        yield from super().onOpen()
-        response = yield from self.rpc(
-            [self.database_api, "get_account_by_name", [self.account["name"]]])
-        self.account["statistics"] = response["statistics"]
-        self.account["id"] = response["id"]
-        statistics_info = self.node_api.get_objects(
-            [self.account["statistics"]])[0]
-        if self.last_trx == "":
-            self.last_trx = statistics_info["most_recent_op"]
-        print("monitor account %s, begin from trx: %s" % (
-            self.account["name"], self.last_trx))
-        self.onStatistics(statistics_info)
-        self.subscribe(self.account["statistics"], self.onStatistics)
+        task = self.pages.pop(row, None)
+        if task is None:
+            task = self.fetch_page(row, table.last_seq[row])
+        start, ops = await task
+        if start < table.target[row]:
+            self.pages[row] = self.fetch_page(row, start)
+        self.prefetch_pages()
+        account = table.account(row)
+        ops = [operation for operation in ops
+               if id_to_int(operation["id"]) > table.last_op[row]]
+        await self.prepare_page(ops, account)
+
+        async def resolve(operation):
+            return operation, await self.resolve_operation(
+                operation, account)
+
+        async def deliver(item):
+            operation, resolved = item
+            await self.deliver_operation(resolved, account)
+            table.last_op[row] = id_to_int(operation["id"])
+            self.save_checkpoint(row)
+        pipeline = OrderedPipeline(
+            resolve, deliver, self.resolve_concurrency)
+        try:
+            for operation in ops:
+                await pipeline.put(operation)
+            await pipeline.join()
+        finally:
+            await pipeline.close()
+        table.last_seq[row] = start
+
+    async def onOpen(self):
+        await self.lookup_apis()
+        table = self.accounts
+        missing = [name for name in table.names
+                   if table.ids[table.rows[name]] < 0]
+        chunks = [missing[i:i+100] for i in range(0, len(missing), 100)]
+        # set_subscribe_callback is sent first, the node answers in order
+        results = await asyncio.gather(
+            self.set_subscribe_callback(), *[self.rpc(
+                [self.database_api, "lookup_account_names", [names]],
+                windowed=False) for names in chunks])
+        for names, accounts in zip(chunks, results[1:]):
+            for name, account in zip(names, accounts):
+                if account is None:
+                    print("unknown account %s" % name)
+                    continue
+                table.set_account(
+                    table.rows[name], account["id"], account["statistics"])
+        self.subscribe("2.6.", self.onStatistics)
+        self.subscribe("2.1.0", self.block_time.update_global_properties)
+        if self.assets is not None:
+            self.subscribe("1.3.", self.assets.update)
+            self.subscribe("2.3.", self.assets.update)
+            # a new connection has to fetch the assets again for their
+            # notices
+            if self._asset_refresh is not None:
+                self._asset_refresh.cancel()
+            self._asset_refresh = asyncio.ensure_future(self.refresh_assets())
+        # fetching the objects subscribes us to them
+        ids = ["2.6.%d" % n for n in table.statistics if n >= 0]
+        results = await asyncio.gather(
+            self.rpc([self.database_api, "get_objects", [["2.1.0"]]],
+                     windowed=False),
+            *[self.rpc([self.database_api, "get_objects", [ids[i:i+100]]],
+                       windowed=False) for i in range(0, len(ids), 100)])
+        self.block_time.update_global_properties(results[0][0])
+        for statistics in itertools.chain(*results[1:]):
+            row = table.by_statistics[id_to_int(statistics["id"])]
+            if table.last_trx[row] < 0:
+                table.last_trx[row] = id_to_int(statistics["most_recent_op"])
+                table.last_seq[row] = statistics["total_ops"]
+                self.save_checkpoint(row)
+            print("monitor account %s, begin from trx: 2.9.%d" % (
+                table.names[row], table.last_trx[row]))
+            self.onStatistics(statistics)
 
 
 if __name__ == '__main__':
@@ -94,7 +394,5 @@ if __name__ == '__main__':
         uri = sys.argv[1]
 
     ws = StatisticsProtocol(uri)
-    node_api = HTTPRPC(uri)
-    ws.init_statistics(
-        node_api, "exchange.btsbots")
+    ws.init_statistics(None, "exchange.btsbots")
     asyncio.get_event_loop().run_until_complete(ws.handler())
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Index of subscription callbacks keyed by object id prefix.
+
+A subscription key matches every object id it is a string prefix of, so
+"1.2.100" gets "1.2.100" and "1.2." notices alike, and "removed" receives
+the notices of removed objects. Instead of comparing every key with every
+notice, only the prefixes of the notice id that have the length of some
+subscribed key are looked up, which keeps dispatch independent of the
+number of subscriptions.
+"""
+
+import itertools
+
+
+class SubscriptionIndex(object):
+    def __init__(self):
+        self.callbacks = {}
+        self._order = {}
+        self._lengths = {}
+        self._counter = itertools.count()
+
+    def __contains__(self, key):
+        return key in self.callbacks
+
+    def __getitem__(self, key):
+        return self.callbacks[key]
+
+    def __iter__(self):
+        return iter(self.callbacks)
+
+    def __len__(self):
+        return len(self.callbacks)
+
+    def add(self, key, callback):
+        if key not in self.callbacks:
+            self.callbacks[key] = [callback]
+            self._order[key] = next(self._counter)
+            self._lengths[len(key)] = self._lengths.get(len(key), 0) + 1
+        else:
+            self.callbacks[key].append(callback)
+
+    def remove(self, key, callback=None):
+        """Drop ``callback`` from ``key``, or every callback if None."""
+        if key not in self.callbacks:
+            return
+        if callback is not None:
+            callbacks = self.callbacks[key]
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if callbacks:
+                return
+        del self.callbacks[key]
+        del self._order[key]
+        self._lengths[len(key)] -= 1
+        if not self._lengths[len(key)]:
+            del self._lengths[len(key)]
+
+    def match(self, object_id):
+        """Return the callbacks for ``object_id`` in subscription order."""
+        keys = []
+        size = len(object_id)
+        for length in self._lengths:
+            if length <= size:
+                key = object_id[:length]
+                if key in self.callbacks:
+                    keys.append(key)
+        if len(keys) > 1:
+            keys.sort(key=self._order.__getitem__)
+        return [_cb for key in keys for _cb in self.callbacks[key]]
@@ -27,7 +27,6 @@
 
 # from pprint import pprint
 from bts.ws.statistics_protocol import StatisticsProtocol
-from bts.http_rpc import HTTPRPC
 
 try:
     import asyncio
@@ -40,40 +39,40 @@ def id_to_int(id):
 
 
 class TradeProtocol(StatisticsProtocol):
-    asset_info = {}
-
-    def get_asset_info(self, asset_id):
-        if asset_id not in self.asset_info:
-            _asset_info = self.node_api.get_objects([asset_id])[0]
-            self.asset_info[asset_id] = _asset_info
-            self.asset_info[_asset_info["symbol"]] = _asset_info
-        return self.asset_info[asset_id]
+    uses_assets = True
 
     def onTrade(self, trx):
         print("sent %s" % trx)
 
-    def process_operations(self, op_id):
-        op_info = self.node_api.get_objects([op_id])
-        for operation in op_info[::-1]:
-            if operation["op"][0] != 4:
-                return
-            op = operation["op"][1]
-            trx = {}
+    async def resolve_operation(self, operation, account):
+        if operation["op"][0] != 4:
+            return None
+        op = operation["op"][1]
+        trx = {}
 
-            trx["block_num"] = operation["block_num"]
-            block_info = self.node_api.get_block(trx["block_num"])
-            trx["timestamp"] = block_info["timestamp"]
-            trx["trx_id"] = operation["id"]
-            # Get trade info
-            for _type in ["pays", "receives", "fee"]:
-                trx[_type] = [0, ""]
-                asset_info = self.get_asset_info(op[_type]["asset_id"])
-                trx[_type][1] = asset_info["symbol"]
-                trx[_type][0] = float(op[_type]["amount"])/float(
-                        10**int(asset_info["precision"]))
+        trx["block_num"] = operation["block_num"]
+        types = ["pays", "receives", "fee"]
+        # the block time and the assets are looked up at the same time
+        results = await asyncio.gather(
+            self.block_time.timestamp(trx["block_num"]),
+            *[self.assets.lookup(op[_type]["asset_id"]) for _type in types])
+        trx["timestamp"] = results[0]
+        trx["trx_id"] = operation["id"]
+        # Get trade info
+        for _type, asset_info in zip(types, results[1:]):
+            trx[_type] = [0, ""]
+            trx[_type][1] = asset_info["symbol"]
+            trx[_type][0] = float(op[_type]["amount"])/asset_info["scale"]
+        return trx
 
+    async def deliver_operation(self, trx, account):
+        if trx is not None:
             self.onTrade(trx)
 
+    async def process_operation(self, operation, account):
+        await self.deliver_operation(
+            await self.resolve_operation(operation, account), account)
+
 
 if __name__ == '__main__':
     import sys
@@ -82,7 +81,5 @@ if __name__ == '__main__':
         uri = sys.argv[1]
 
     ws = TradeProtocol(uri)
-    node_api = HTTPRPC(uri)
-    ws.init_statistics(
-        node_api, "exchange.btsbots")
+    ws.init_statistics(None, "exchange.btsbots")
     asyncio.get_event_loop().run_until_complete(ws.handler())
@@ -26,12 +26,9 @@
 ###############################################################################
 
 # from pprint import pprint
+from bts.memo import MemoDecoder
+from bts.ws.account_names import AccountNameResolver
 from bts.ws.statistics_protocol import StatisticsProtocol
-from bts.http_rpc import HTTPRPC
-try:
-    from graphenebase import Memo, PrivateKey, PublicKey
-except ImportError:
-    print("[warnning] need python-graphinelib to use transfer protocol")
 
 try:
     import asyncio
@@ -44,21 +41,55 @@ def id_to_int(id):
 
 
 class TransferProtocol(StatisticsProtocol):
+    uses_assets = True
     prefix = "BTS"
     memo_key = ""
-    asset_info = {}
-
-    def init_transfer_monitor(self, node_api, prefix, account_name, memo_key):
+    # a process pool decoding the memos of history pages, None decodes
+    # each memo on the event loop
+    memo_executor = None
+
+    def __init__(self, *args, **kwargs):
+        super(TransferProtocol, self).__init__(*args, **kwargs)
+        # the parties of the transfers resolved together share a request
+        self.account_names = AccountNameResolver(self.node_api)
+        self.memo_decoder = None
+        # decoded ahead in the pool, by operation id
+        self.memo_texts = {}
+
+    def init_statistics(self, node_api, account_names):
+        super(TransferProtocol, self).init_statistics(node_api, account_names)
+        self.account_names.node_api = self.node_api
+
+    def init_transfer_monitor(self, node_api, prefix, account_name, memo_key,
+                              memo_executor=None):
         self.init_statistics(node_api, account_name)
         self.prefix = prefix
         self.memo_key = memo_key
-
-    def get_asset_info(self, asset_id):
-        if asset_id not in self.asset_info:
-            _asset_info = self.node_api.get_objects([asset_id])[0]
-            self.asset_info[asset_id] = _asset_info
-            self.asset_info[_asset_info["symbol"]] = _asset_info
-        return self.asset_info[asset_id]
+        self.memo_executor = memo_executor
+        # the key is parsed once, shared secrets are cached per sender
+        self.memo_decoder = None
+        if memo_key:
+            try:
+                self.memo_decoder = MemoDecoder(memo_key, prefix)
+            except Exception as err:
+                # memos are then passed on as None
+                print("can't decode memos: %r" % err)
+
+    async def prepare_page(self, ops, account):
+        if self.memo_decoder is None or self.memo_executor is None:
+            return
+        transfers = [operation for operation in ops
+                     if operation["op"][0] == 0 and "memo" in operation[
+                         "op"][1]]
+        if not transfers:
+            return
+        texts = await self.memo_decoder.decode_pooled(
+            [self.memo_decoder.memo_args(
+                operation["op"][1]["memo"], account["id"],
+                operation["op"][1]["to"]) for operation in transfers],
+            self.memo_executor)
+        for operation, text in zip(transfers, texts):
+            self.memo_texts[operation["id"]] = text
 
     def onSent(self, trx):
         print("sent %s" % trx)
@@ -66,54 +97,58 @@ class TransferProtocol(StatisticsProtocol):
     def onReceive(self, trx):
         print("receive %s" % trx)
 
-    def process_operations(self, op_id):
-        op_info = self.node_api.get_objects([op_id])
-        for operation in op_info[::-1]:
-            if operation["op"][0] != 0:
-                return
-            op = operation["op"][1]
-            trx = {}
-
-            # trx["timestamp"] = datetime.datetime.utcnow().strftime(
-            #     "%Y%m%d %H:%M")
-            trx["block_num"] = operation["block_num"]
-            block_info = self.node_api.get_block(trx["block_num"])
-            trx["timestamp"] = block_info["timestamp"]
-            trx["trx_id"] = operation["id"]
-            # Get amount
-            asset_info = self.get_asset_info(op["amount"]["asset_id"])
-            trx["asset"] = asset_info["symbol"]
-            trx["amount"] = float(op["amount"]["amount"])/float(
-                10**int(asset_info["precision"]))
-
-            # Get accounts involved
-            trx["from_id"] = op["from"]
-            trx["to_id"] = op["to"]
-            trx["from"] = self.node_api.get_objects([op["from"]])[0]["name"]
-            trx["to"] = self.node_api.get_objects([op["to"]])[0]["name"]
-
-            # Decode the memo
-            if "memo" in op:
-                memo = op["memo"]
-                trx["nonce"] = memo["nonce"]
-                try:
-                    privkey = PrivateKey(self.memo_key)
-                    if trx["to_id"] == self.account["id"]:
-                        pubkey = PublicKey(memo["from"], prefix=self.prefix)
-                    else:
-                        pubkey = PublicKey(memo["to"], prefix=self.prefix)
-                    trx["memo"] = Memo.decode_memo(
-                        privkey, pubkey, memo["nonce"], memo["message"])
-                except Exception:
-                    trx["memo"] = None
-            else:
-                trx["nonce"] = None
+    async def resolve_operation(self, operation, account):
+        if operation["op"][0] != 0:
+            return None
+        op = operation["op"][1]
+        trx = {}
+
+        # trx["timestamp"] = datetime.datetime.utcnow().strftime(
+        #     "%Y%m%d %H:%M")
+        trx["block_num"] = operation["block_num"]
+        # the block time, the asset and the accounts are looked up together
+        trx["timestamp"], asset_info, names = await asyncio.gather(
+            self.block_time.timestamp(trx["block_num"]),
+            self.assets.lookup(op["amount"]["asset_id"]),
+            self.account_names.names([op["from"], op["to"]]))
+        trx["trx_id"] = operation["id"]
+        # Get amount
+        trx["asset"] = asset_info["symbol"]
+        trx["amount"] = float(op["amount"]["amount"])/asset_info["scale"]
+
+        # Get accounts involved
+        trx["from_id"] = op["from"]
+        trx["to_id"] = op["to"]
+        trx["from"], trx["to"] = names
+
+        # Decode the memo
+        if "memo" in op:
+            memo = op["memo"]
+            trx["nonce"] = memo["nonce"]
+            try:
+                if operation["id"] in self.memo_texts:
+                    trx["memo"] = self.memo_texts.pop(operation["id"])
+                else:
+                    trx["memo"] = self.memo_decoder.decode_memo(
+                        memo, account["id"], trx["to_id"])
+            except Exception:
                 trx["memo"] = None
+        else:
+            trx["nonce"] = None
+            trx["memo"] = None
+        return trx
+
+    async def deliver_operation(self, trx, account):
+        if trx is None:
+            return
+        if trx["from_id"] == account["id"]:
+            self.onSent(trx)
+        elif trx["to_id"] == account["id"]:
+            self.onReceive(trx)
 
-            if trx["from_id"] == self.account["id"]:
-                self.onSent(trx)
-            elif trx["to_id"] == self.account["id"]:
-                self.onReceive(trx)
+    async def process_operation(self, operation, account):
+        await self.deliver_operation(
+            await self.resolve_operation(operation, account), account)
 
 
 if __name__ == '__main__':
@@ -123,8 +158,7 @@ if __name__ == '__main__':
         uri = sys.argv[1]
 
     ws = TransferProtocol(uri)
-    node_api = HTTPRPC(uri)
     ws.init_transfer_monitor(
-        node_api, "BTS", "nathan",
+        None, "BTS", "nathan",
         "5KQwrPbwdL6PhXujxW37FSSQZ1JiwsST4cqQzDeyXtP79zkvFD3")
     asyncio.get_event_loop().run_until_complete(ws.handler())
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Bound the number of requests in flight on a connection.
+
+Requests go through one of three lanes, ``"realtime"``, ``"normal"`` and
+``"bulk"``. When ``size`` requests are in flight, further ones wait for a
+slot; a free slot goes to the oldest waiter of the highest lane, so
+realtime calls jump every queue and bulk calls only get slots nobody else
+is waiting for. ``max_bulk`` also caps the bulk requests in flight, which
+leaves room for the other lanes even when no total ``size`` is set.
+Within a lane requests are let in first come, first served.
+"""
+
+from collections import deque
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+LANES = ("realtime", "normal", "bulk")
+
+
+class RequestWindow(object):
+    def __init__(self, size=None, max_bulk=None):
+        self.size = size
+        self.max_bulk = max_bulk
+        self.in_flight = 0
+        self.lane_in_flight = dict.fromkeys(LANES, 0)
+        self.stats = {"queued": 0, "high_water": 0}
+        self._waiters = dict((lane, deque()) for lane in LANES)
+
+    def waiting(self, lane=None):
+        if lane is None:
+            return sum(len(queue) for queue in self._waiters.values())
+        return len(self._waiters[lane])
+
+    def _has_room(self, lane):
+        if self.size is not None and self.in_flight >= self.size:
+            return False
+        return lane != "bulk" or self.max_bulk is None or \
+            self.lane_in_flight["bulk"] < self.max_bulk
+
+    async def acquire(self, lane="normal"):
+        if lane not in self._waiters:
+            raise ValueError("unknown lane %s, use one of %s" % (
+                lane, ", ".join(LANES)))
+        ahead = LANES[:LANES.index(lane) + 1]
+        if self._has_room(lane) and \
+                not any(self._waiters[_lane] for _lane in ahead):
+            self._take(lane)
+            return
+        waiter = asyncio.Future()
+        self._waiters[lane].append(waiter)
+        self.stats["queued"] += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over already, pass it on
+                self.release(lane)
+            elif waiter in self._waiters[lane]:
+                self._waiters[lane].remove(waiter)
+            raise
+
+    def release(self, lane="normal"):
+        self.in_flight -= 1
+        self.lane_in_flight[lane] -= 1
+        for _lane in LANES:
+            queue = self._waiters[_lane]
+            while queue and self._has_room(_lane):
+                waiter = queue.popleft()
+                # skip waiters cancelled before they got to clean up
+                if not waiter.done():
+                    self._take(_lane)
+                    waiter.set_result(None)
+
+    def _take(self, lane):
+        self.in_flight += 1
+        self.lane_in_flight[lane] += 1
+        if self.in_flight > self.stats["high_water"]:
+            self.stats["high_water"] = self.in_flight
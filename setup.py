@@ -221,6 +221,10 @@ python_version_specific_requires = []
 if sys.version_info < (2, 7) or (3, 0) <= sys.version_info < (3, 3):
     python_version_specific_requires.append('argparse')
 
+# concurrent.futures is in the standard library as of Python 3.2
+if sys.version_info < (3, 2):
+    python_version_specific_requires.append('futures')
+
 
 # See here for more options:
 # <http://pythonhosted.org/setuptools/setuptools.html>
@@ -256,7 +260,7 @@ setup_dict = dict(
     packages=find_packages(exclude=(TESTS_DIRECTORY,)),
     install_requires=[
         "graphenelib==0.4.8", "requests==2.10.0",
-        "scrypt==0.7.1", "ecdsa==0.13", "websockets"
+        "scrypt==0.7.1", "ecdsa==0.13", "websockets", "aiohttp"
         # your module dependencies
     ] + python_version_specific_requires,
     # Allow tests to be run with `python setup.py test'.
@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""Minimal local stand-in for a graphene node, used by tests and benchmarks.
+
+Only the ``call`` JSON-RPC envelope is understood. Methods are plain python
+callables registered in ``handlers``; they receive the call arguments and
+return the result, or raise :class:`StubError` to produce an error reply.
+``run`` and ``wait_for`` drive the event loop of a test.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+class StubError(Exception):
+    pass
+
+
+def default_handlers():
+    return {
+        "get_dynamic_global_properties": lambda: {
+            "id": "2.1.0", "head_block_number": 100},
+        "get_objects": lambda ids: [{"id": _id} for _id in ids],
+        "get_block": lambda num: {
+            "timestamp": "2016-01-01T00:00:00", "block_num": num},
+    }
+
+
+def handle_request(handlers, request):
+    api, name, args = request["params"]
+    reply = {"id": request.get("id"), "jsonrpc": "2.0"}
+    if name not in handlers:
+        reply["error"] = {"message": "no method %s" % name}
+        return reply
+    try:
+        reply["result"] = handlers[name](*args)
+    except StubError as err:
+        reply["error"] = {"message": str(err)}
+    return reply
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.node.count("connections")
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        node = self.server.node
+        node.count("requests")
+        node.enter()
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if node.delay:
+            time.sleep(node.delay)
+        node.leave()
+        payload = json.loads(body.decode("utf8"))
+        if isinstance(payload, list):
+            node.count("calls", len(payload))
+            reply = [handle_request(node.handlers, r) for r in payload]
+        else:
+            node.count("calls")
+            reply = handle_request(node.handlers, payload)
+        data = json.dumps(reply).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubHTTPNode(object):
+    def __init__(self, handlers=None, delay=0):
+        self.handlers = default_handlers()
+        self.handlers.update(handlers or {})
+        self.delay = delay
+        self.stats = {"connections": 0, "requests": 0, "calls": 0,
+                      "active": 0, "max_active": 0}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def enter(self):
+        with self._lock:
+            self.stats["active"] += 1
+            self.stats["max_active"] = max(
+                self.stats["max_active"], self.stats["active"])
+
+    def leave(self):
+        with self._lock:
+            self.stats["active"] -= 1
+
+    @property
+    def uri(self):
+        return "http://127.0.0.1:%d/" % self._server.server_address[1]
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.node = self
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+API_IDS = {"database": 2, "history": 3, "network_broadcast": 4}
+
+
+def login_handlers():
+    handlers = {"login": lambda user, password: True}
+    for name, api_id in API_IDS.items():
+        handlers[name] = (lambda _id: lambda: _id)(api_id)
+    return handlers
+
+
+class StubWSNode(object):
+    """Websocket node on localhost, run inside the test's event loop."""
+    def __init__(self, handlers=None, delay=0):
+        import websockets
+        self._serve = websockets.serve
+        self.handlers = default_handlers()
+        self.handlers.update(login_handlers())
+        self.handlers["set_subscribe_callback"] = self.set_subscribe_callback
+        self.handlers.update(handlers or {})
+        self.delay = delay
+        self.requests = []
+        self.subscribe_id = None
+        self.connections = set()
+        self._server = None
+
+    def set_subscribe_callback(self, callback_id, clear_filter):
+        self.subscribe_id = callback_id
+
+    @property
+    def uri(self):
+        return "ws://127.0.0.1:%d" % self.port
+
+    async def start(self, port=0):
+        self._server = await self._serve(self._handle, "127.0.0.1", port)
+        self.port = list(self._server.sockets)[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        for websocket in list(self.connections):
+            await websocket.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, websocket, *args):
+        self.connections.add(websocket)
+        try:
+            async for message in websocket:
+                request = json.loads(message)
+                self.requests.append(request)
+                asyncio.ensure_future(self._reply(websocket, request))
+        except Exception:
+            pass
+        finally:
+            self.connections.discard(websocket)
+
+    async def _reply(self, websocket, request):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        try:
+            await websocket.send(
+                json.dumps(handle_request(self.handlers, request)))
+        except Exception:
+            pass
+
+    async def notify(self, objects):
+        notice = json.dumps(
+            {"method": "notice", "params": [self.subscribe_id, [objects]]})
+        for websocket in list(self.connections):
+            await websocket.send(notice)
+
+
+class StubWebsocket(object):
+    """In-process stand-in for the websocket of a BaseProtocol."""
+    def __init__(self, protocol, handlers=None, delay=0):
+        self.protocol = protocol
+        self.handlers = default_handlers()
+        self.handlers.update(handlers or {})
+        self.delay = delay
+        self.sent = []
+
+    async def send(self, data):
+        request = json.loads(data)
+        self.sent.append(request)
+        reply = json.dumps(handle_request(self.handlers, request))
+        asyncio.get_event_loop().call_later(
+            self.delay, self.protocol.onMessage, reply)
+
+
+class StubChain(object):
+    """A tiny chain with a monitored account, for protocol tests."""
+    block_time = 1470009600  # 2016-08-01T00:00:00
+
+    def __init__(self, name="alice", account_id="1.2.100"):
+        self.objects = {}
+        self.histories = {}
+        self.account = {"name": name, "id": account_id,
+                        "statistics": "2.6.%s" % account_id.split(".")[2]}
+        self.add_account(name, account_id)
+        self.add_account("bob", "1.2.200")
+        self.add_asset("1.3.0", "BTS", 5)
+        self.add_asset("1.3.1", "CNY", 4)
+        # sentinel history entry, real operations start after it
+        self.next_op = 10
+        self.next_trx = 10
+        self.objects["2.9.9"] = {
+            "id": "2.9.9", "account": account_id, "operation_id": "1.11.9",
+            "sequence": 0, "next": "2.9.0"}
+        self.statistics["most_recent_op"] = "2.9.9"
+        self.set_head(100)
+
+    def add_account(self, name, account_id):
+        statistics_id = "2.6.%s" % account_id.split(".")[2]
+        self.objects[account_id] = {
+            "id": account_id, "name": name, "statistics": statistics_id}
+        self.objects[statistics_id] = {
+            "id": statistics_id, "owner": account_id,
+            "most_recent_op": "2.9.0", "total_ops": 0}
+        self.histories[account_id] = []
+
+    def add_asset(self, asset_id, symbol, precision):
+        dynamic_id = "2.3.%s" % asset_id.split(".")[2]
+        self.objects[asset_id] = {
+            "id": asset_id, "symbol": symbol, "precision": precision,
+            "dynamic_asset_data_id": dynamic_id}
+        self.objects[dynamic_id] = {"id": dynamic_id, "current_supply": 0}
+
+    @property
+    def statistics(self):
+        return self.statistics_of(self.account["id"])
+
+    def statistics_of(self, account_id):
+        return self.objects[self.objects[account_id]["statistics"]]
+
+    def set_head(self, block_num):
+        self.head_block = block_num
+        self.objects["2.1.0"] = {
+            "id": "2.1.0", "head_block_number": block_num,
+            "time": self.timestamp(block_num)}
+
+    @property
+    def global_properties(self):
+        return self.objects["2.1.0"]
+
+    def timestamp(self, block_num):
+        return time.strftime(
+            "%Y-%m-%dT%H:%M:%S",
+            time.gmtime(self.block_time + 3 * block_num))
+
+    def add_operation(self, op, block_num=None, accounts=None):
+        """Add ``op`` to the history of ``accounts``, by default ours."""
+        num = self.next_op
+        self.next_op += 1
+        self.set_head(block_num or self.head_block + 1)
+        self.objects["1.11.%d" % num] = {
+            "id": "1.11.%d" % num, "op": op, "result": [0, {}],
+            "block_num": self.head_block, "trx_in_block": 0,
+            "op_in_trx": 0, "virtual_op": num}
+        for account_id in accounts or [self.account["id"]]:
+            statistics = self.statistics_of(account_id)
+            trx_id = "2.9.%d" % self.next_trx
+            self.next_trx += 1
+            self.objects[trx_id] = {
+                "id": trx_id, "account": account_id,
+                "operation_id": "1.11.%d" % num,
+                "sequence": statistics["total_ops"] + 1,
+                "next": statistics["most_recent_op"]}
+            statistics["most_recent_op"] = trx_id
+            statistics["total_ops"] += 1
+            self.histories[account_id].append("1.11.%d" % num)
+        return self.objects["1.11.%d" % num]
+
+    def fill(self, pays, receives, fee=(0, "1.3.0"), block_num=None,
+             account=None):
+        account = account or self.account["id"]
+        return self.add_operation([4, {
+            "account_id": account, "order_id": "1.7.1",
+            "pays": {"amount": pays[0], "asset_id": pays[1]},
+            "receives": {"amount": receives[0], "asset_id": receives[1]},
+            "fee": {"amount": fee[0], "asset_id": fee[1]}}], block_num,
+            [account])
+
+    def transfer(self, sender, receiver, amount, memo=None, block_num=None):
+        op = {"from": sender, "to": receiver,
+              "amount": {"amount": amount[0], "asset_id": amount[1]},
+              "fee": {"amount": 100, "asset_id": "1.3.0"}}
+        if memo is not None:
+            op["memo"] = memo
+        return self.add_operation([0, op], block_num)
+
+    def history(self, account_id=None):
+        """Operation objects of the account, oldest first."""
+        return [self.objects[op_id] for op_id in
+                self.histories[account_id or self.account["id"]]]
+
+    def get_block(self, block_num):
+        if block_num > self.head_block:
+            return None
+        return {"block_num": block_num, "timestamp": self.timestamp(
+            block_num), "witness": "1.6.1", "transactions": []}
+
+    def get_block_header(self, block_num):
+        block = self.get_block(block_num)
+        if block is not None:
+            del block["transactions"]
+        return block
+
+    def lookup_account_names(self, names):
+        accounts = dict((obj["name"], obj) for obj in self.objects.values()
+                        if "name" in obj)
+        return [accounts.get(name) for name in names]
+
+    def lookup_asset_symbols(self, symbols):
+        assets = dict((obj["symbol"], obj) for obj in self.objects.values()
+                      if obj["id"].startswith("1.3."))
+        return [assets.get(symbol) for symbol in symbols]
+
+    def list_assets(self, lower_bound_symbol, limit):
+        if limit > 100:
+            raise StubError("limit of 100 exceeded")
+        assets = sorted((obj for obj in self.objects.values()
+                         if obj["id"].startswith("1.3.")),
+                        key=lambda asset: asset["symbol"])
+        return [asset for asset in assets
+                if asset["symbol"] >= lower_bound_symbol][:limit]
+
+    def get_relative_account_history(self, account, stop, limit, start):
+        if limit > 100:
+            raise StubError("limit of 100 exceeded")
+        history = self.history(account)
+        start = len(history) if not start else min(start, len(history))
+        return [history[seq - 1]
+                for seq in range(start, max(stop, 1) - 1, -1)][:limit]
+
+    def handlers(self):
+        return {
+            "get_relative_account_history":
+                self.get_relative_account_history,
+            "get_objects": lambda ids: [
+                self.objects.get(_id) for _id in ids],
+            "get_account_by_name": lambda name: [
+                obj for obj in self.objects.values()
+                if obj.get("name") == name][0],
+            "lookup_account_names": self.lookup_account_names,
+            "list_assets": self.list_assets,
+            "lookup_asset_symbols": self.lookup_asset_symbols,
+            "get_block": self.get_block,
+            "get_block_header": self.get_block_header,
+        }
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def wait_for(condition, timeout=2):
+    for i in range(int(timeout / 0.005)):
+        if condition():
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError("timed out")
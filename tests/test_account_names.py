@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from bts.ws.account_names import AccountNameResolver
+from bts.ws.base_protocol import BaseProtocol
+from bts.ws.transfer_protocol import TransferProtocol
+from stub_node import StubChain, StubWebsocket, StubWSNode, run, wait_for
+
+
+class RecordingTransfer(TransferProtocol):
+    def onSent(self, trx):
+        self.transfers.append(trx)
+
+    def onReceive(self, trx):
+        self.transfers.append(trx)
+
+
+def resolver(chain, **kw):
+    protocol = BaseProtocol()
+    protocol.websocket = StubWebsocket(protocol, chain.handlers(), 0.005)
+    return AccountNameResolver(protocol.node_api, **kw), protocol.websocket
+
+
+class TestAccountNameResolver(object):
+    def test_batched_lookup(self):
+        chain = StubChain()
+        for n in range(3, 10):
+            chain.add_account("user%d" % n, "1.2.%d00" % n)
+        ids = ["1.2.%d00" % n for n in range(1, 10)]
+
+        async def main():
+            names, websocket = resolver(chain, max_size=4)
+            first = await asyncio.gather(
+                *[names.names([ids[i % 9], ids[(i + 1) % 9]])
+                  for i in range(18)])
+            again = await names.names(ids[-4:])
+            return names, websocket.sent, first, again
+        names, sent, first, again = run(main())
+        assert first[2] == ["user3", "user4"]
+        assert again == ["user6", "user7", "user8", "user9"]
+        # the first pass asked for the 9 ids once, in one request
+        assert [r["params"][2] for r in sent] == [[ids]]
+        assert names.stats == {"hits": 4, "misses": 36, "batches": 1}
+        assert names.hit_rate() == 0.1
+
+    def test_unknown_account(self):
+        chain = StubChain()
+
+        async def main():
+            names, websocket = resolver(chain, max_batch=2)
+            return await asyncio.gather(
+                names.name("1.2.100"), names.name("1.2.999"),
+                names.name("1.2.200"), return_exceptions=True)
+        alice, unknown, bob = run(main())
+        assert (alice, bob) == ("alice", "bob")
+        assert isinstance(unknown, ValueError)
+
+
+class TestTransferNames(object):
+    def test_one_lookup_per_page(self):
+        chain = StubChain()
+        for n in range(3, 10):
+            chain.add_account("user%d" % n, "1.2.%d00" % n)
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = RecordingTransfer(node.uri)
+            protocol.transfers = []
+            protocol.init_transfer_monitor(None, "BTS", "alice", "")
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            for n in range(3, 10):
+                chain.transfer("1.2.%d00" % n, "1.2.100", (1000, "1.3.0"))
+            chain.transfer("1.2.100", "1.2.300", (1000, "1.3.0"))
+            await node.notify([chain.statistics])
+            await wait_for(lambda: len(protocol.transfers) == 8)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol, node.requests
+        protocol, requests = run(main())
+        assert [trx["from"] for trx in protocol.transfers] == [
+            "user%d" % n for n in range(3, 10)] + ["alice"]
+        assert protocol.transfers[-1]["to"] == "user3"
+        assert protocol.transfers[0]["amount"] == 0.01
+        lookups = [r["params"][2][0] for r in requests
+                   if r["params"][1] == "get_objects" and
+                   r["params"][2][0][0].startswith("1.2.")]
+        assert len(lookups) == 1
+        assert sorted(lookups[0]) == ["1.2.%d00" % n for n in range(1, 10)
+                                      if n != 2]
+        assert protocol.account_names.stats["batches"] == 1
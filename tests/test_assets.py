@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from bts.ws.assets import AssetRegistry
+from bts.ws.base_protocol import BaseProtocol
+from bts.ws.trade_protocol import TradeProtocol
+from stub_node import StubChain, StubWebsocket, StubWSNode, run, wait_for
+
+
+class RecordingTrade(TradeProtocol):
+    def onTrade(self, trx):
+        self.trades.append(trx)
+
+
+def registry(chain, **kw):
+    protocol = BaseProtocol()
+    protocol.websocket = StubWebsocket(protocol, chain.handlers())
+    return AssetRegistry(protocol.node_api, **kw), protocol.websocket
+
+
+class TestAssetRegistry(object):
+    def test_preload_pages(self, tmpdir):
+        chain = StubChain()
+        for n in range(2, 250):
+            chain.add_asset("1.3.%d" % n, "A%03d" % n, n % 9)
+        path = str(tmpdir.join("assets.json"))
+
+        async def main():
+            assets, websocket = registry(chain, snapshot_path=path)
+            await assets.preload()
+            return assets, websocket.sent
+        assets, sent = run(main())
+        assert len(assets) == 250
+        assert [r["params"][1] for r in sent] == ["list_assets"] * 3
+        assert assets.get("A123") is assets.get("1.3.123")
+        assert assets.get("CNY")["scale"] == 10000.0
+
+        # a restart starts from the snapshot, only the asset looked up is
+        # fetched for its notices
+        async def restart():
+            assets, websocket = registry(chain, snapshot_path=path)
+            info = await assets.lookup("1.3.200")
+            await wait_for(lambda: websocket.sent)
+            return assets, websocket.sent, info
+        assets, sent, info = run(restart())
+        assert assets.loaded and len(assets) == 250
+        assert [r["params"][1:] for r in sent] == [
+            ["get_objects", [["1.3.200", "2.3.200"]]]]
+        assert info["symbol"] == "A200" and info["scale"] == 10.0 ** 2
+
+    def test_lookup_and_notices(self):
+        chain = StubChain()
+
+        async def main():
+            assets, websocket = registry(chain)
+            infos = await asyncio.gather(
+                *[assets.lookup("1.3.1") for i in range(5)])
+            await wait_for(lambda: len(websocket.sent) == 2)
+            return assets, websocket.sent, infos
+        assets, sent, infos = run(main())
+        assert infos[0]["symbol"] == "CNY"
+        # one fetch, then one subscription with the dynamic data
+        assert [r["params"][2] for r in sent] == [
+            [["1.3.1"]], [["1.3.1", "2.3.1"]]]
+        assets.update({"id": "1.3.1", "symbol": "CNY", "precision": 2,
+                       "dynamic_asset_data_id": "2.3.1"})
+        assets.update({"id": "2.3.1", "current_supply": 1000})
+        assets.update({"id": "2.3.99", "current_supply": 1})
+        info = assets.get("CNY")
+        assert info["scale"] == 100.0
+        assert info["dynamic"]["current_supply"] == 1000
+
+    def test_lookup_by_symbol(self):
+        chain = StubChain()
+        chain.add_asset("1.3.2", "USD", 4)
+
+        async def main():
+            assets, websocket = registry(chain)
+            info = await assets.lookup("USD")
+            try:
+                await assets.lookup("NOPE")
+            except ValueError as err:
+                error = err
+            return websocket.sent, info, error
+        sent, info, error = run(main())
+        assert [r["params"][1:] for r in sent
+                if r["params"][1] != "get_objects"] == [
+            ["lookup_asset_symbols", [["USD"]]],
+            ["lookup_asset_symbols", [["NOPE"]]]]
+        assert info["id"] == "1.3.2" and info["scale"] == 10000.0
+        assert str(error) == "unknown asset NOPE"
+
+
+class TestTradeAssets(object):
+    def test_preloaded_on_open(self):
+        chain = StubChain()
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = RecordingTrade(node.uri)
+            protocol.trades = []
+            protocol.init_statistics(None, "alice")
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            await wait_for(lambda: protocol.assets.loaded)
+            chain.fill((100000, "1.3.0"), (20000, "1.3.1"))
+            await node.notify([chain.statistics])
+            await wait_for(lambda: len(protocol.trades) == 1)
+            await wait_for(lambda: any(
+                r["params"][1] == "get_objects" and
+                r["params"][2][0][0] == "1.3.0" for r in node.requests))
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol.trades, node.requests
+        trades, requests = run(main())
+        assert trades[0]["pays"] == [1.0, "BTS"]
+        assert trades[0]["receives"] == [2.0, "CNY"]
+        # no lookups, the assets of the trade are only fetched for their
+        # notices
+        assert [r["params"][2] for r in requests
+                if r["params"][1] == "get_objects" and
+                r["params"][2][0][0].startswith("1.3.")] == [
+                    [["1.3.0", "2.3.0", "1.3.1", "2.3.1"]]]
+
+    def test_shared_registry_follows_notices(self, tmpdir):
+        chain = StubChain()
+        path = str(tmpdir.join("assets.json"))
+        snapshot = AssetRegistry(snapshot_path=path)
+        for asset_id in ("1.3.0", "1.3.1"):
+            snapshot.add(chain.objects[asset_id])
+        snapshot.save()
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            assets = AssetRegistry(snapshot_path=path, save_interval=0)
+            protocol = RecordingTrade(node.uri, assets=assets)
+            protocol.trades = []
+            protocol.init_statistics(None, "alice")
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            chain.fill((100000, "1.3.0"), (20000, "1.3.1"))
+            await node.notify([chain.statistics])
+            await wait_for(lambda: len(protocol.trades) == 1 and any(
+                r["params"][1] == "get_objects" and
+                "2.3.1" in r["params"][2][0] for r in node.requests))
+            chain.objects["1.3.1"]["precision"] = 2
+            chain.objects["2.3.1"]["current_supply"] = 500
+            await node.notify([chain.objects["1.3.1"],
+                               chain.objects["2.3.1"]])
+            await wait_for(lambda: assets.get("CNY")["scale"] == 100.0)
+            chain.fill((100000, "1.3.0"), (20000, "1.3.1"))
+            await node.notify([chain.statistics])
+            await wait_for(lambda: len(protocol.trades) == 2)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol.trades, assets, node.requests
+        trades, assets, requests = run(main())
+        # warm start from the snapshot, without a preload
+        assert "list_assets" not in [r["params"][1] for r in requests]
+        assert trades[0]["receives"] == [2.0, "CNY"]
+        assert trades[1]["receives"] == [200.0, "CNY"]
+        assert assets.get("1.3.1")["dynamic"]["current_supply"] == 500
+        # a restart starts from what the notices changed
+        snapshot = AssetRegistry(snapshot_path=path)
+        assert snapshot.loaded
+        assert snapshot.get("CNY")["scale"] == 100.0
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+from bts.async_http_rpc import AsyncHTTPRPC
+from bts.http_rpc import RPCError, RPCConnection
+from stub_node import StubHTTPNode, run
+
+
+class TestAsyncHTTPRPC(object):
+    def test_calls(self):
+        async def main(uri):
+            async with AsyncHTTPRPC(uri) as rpc:
+                block = await rpc.get_block(10)
+                assert block["block_num"] == 10
+                with pytest.raises(RPCError):
+                    await rpc.no_such_method()
+        with StubHTTPNode() as node:
+            run(main(node.uri))
+            assert node.stats["connections"] == 1
+
+    def test_concurrency_limit(self):
+        async def main(uri):
+            async with AsyncHTTPRPC(uri, max_concurrency=3) as rpc:
+                blocks = await asyncio.gather(
+                    *[rpc.get_block(i) for i in range(12)])
+                assert [b["block_num"] for b in blocks] == list(range(12))
+        with StubHTTPNode(delay=0.05) as node:
+            run(main(node.uri))
+            assert node.stats["max_active"] == 3
+            assert node.stats["connections"] == 3
+
+    def test_connection_error(self):
+        async def main():
+            async with AsyncHTTPRPC("http://127.0.0.1:1/") as rpc:
+                with pytest.raises(RPCConnection):
+                    await rpc.get_block(1)
+        run(main())
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from concurrent import futures
+
+from bts.ws.backfill import Backfill
+from bts.ws.base_protocol import BaseProtocol
+from bts.ws.statistics_protocol import StatisticsProtocol
+from stub_node import StubChain, StubWebsocket, StubWSNode, run
+
+
+def op_number(operation):
+    return int(operation["id"].split(".")[2])
+
+
+def make_chain(count):
+    chain = StubChain()
+    for i in range(count):
+        chain.fill((i, "1.3.0"), (1, "1.3.1"))
+    return chain
+
+
+class TestBackfill(object):
+    def backfill(self, chain, delay=0.005, **kw):
+        async def main():
+            protocol = BaseProtocol()
+            protocol.history_api = 3
+            in_flight = []
+            handlers = chain.handlers()
+            history = handlers["get_relative_account_history"]
+
+            def get_history(*args):
+                in_flight.append(len(protocol.result))
+                return history(*args)
+            handlers["get_relative_account_history"] = get_history
+            protocol.websocket = StubWebsocket(protocol, handlers, delay)
+            received = []
+            backfill = Backfill(protocol, "1.2.100", received.append, **kw)
+            await backfill.run()
+            return backfill, received, in_flight
+        return run(main())
+
+    def test_in_order(self):
+        chain = make_chain(1050)
+        backfill, received, in_flight = self.backfill(
+            chain, parallelism=8, decode=op_number)
+        assert received == list(range(10, 1060))
+        assert backfill.stats["pages"] == 11
+        assert max(in_flight) == 8
+
+    def test_decode_in_pool(self):
+        chain = make_chain(250)
+        with futures.ThreadPoolExecutor(4) as executor:
+            backfill, received, in_flight = self.backfill(
+                chain, decode=op_number, executor=executor)
+        assert received == list(range(10, 260))
+
+    def test_out_of_order_replies(self):
+        chain = make_chain(300)
+        delays = iter([0.05, 0.01, 0.03])
+
+        class ShuffledWebsocket(StubWebsocket):
+            async def send(self, data):
+                self.delay = next(delays, 0)
+                await super(ShuffledWebsocket, self).send(data)
+
+        async def main():
+            protocol = BaseProtocol()
+            protocol.websocket = ShuffledWebsocket(protocol, chain.handlers())
+            received = []
+            await Backfill(protocol, "1.2.100", received.append).run(1, 300)
+            return received
+        received = run(main())
+        assert [op["id"] for op in received] == [
+            "1.11.%d" % n for n in range(10, 310)]
+
+    def test_protocol_backfill(self):
+        chain = make_chain(120)
+
+        class Recording(StatisticsProtocol):
+            async def process_operation(self, operation, account):
+                self.processed.append((account["name"], operation["id"]))
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = Recording(node.uri)
+            protocol.processed = []
+            protocol.init_statistics(None, "alice")
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            await protocol.backfill("alice", parallelism=2).run()
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol.processed
+        processed = run(main())
+        assert processed == [("alice", "1.11.%d" % n)
+                             for n in range(10, 130)]
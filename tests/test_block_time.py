@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from bts.ws.base_protocol import BaseProtocol
+from bts.ws.block_time import BlockTimeResolver
+from bts.ws.trade_protocol import TradeProtocol
+from stub_node import StubChain, StubWebsocket, StubWSNode, run, wait_for
+
+
+class RecordingTrade(TradeProtocol):
+    def onTrade(self, trx):
+        self.trades.append(trx)
+
+
+def resolver(chain, **kw):
+    protocol = BaseProtocol()
+    protocol.websocket = StubWebsocket(protocol, chain.handlers(), 0.005)
+    return BlockTimeResolver(protocol.node_api, **kw), protocol.websocket
+
+
+class TestBlockTimeResolver(object):
+    def test_header_fetch_coalesced(self):
+        chain = StubChain()
+
+        async def main():
+            block_time, websocket = resolver(chain, max_size=2)
+            times = await asyncio.gather(
+                *[block_time.timestamp(50) for i in range(10)])
+            for num in (51, 52, 50):
+                await block_time.timestamp(num)
+            return block_time, websocket.sent, times
+        block_time, sent, times = run(main())
+        assert set(times) == set([chain.timestamp(50)])
+        # 50 was evicted by 51 and 52
+        assert [r["params"][1:] for r in sent] == [
+            ["get_block_header", [50]], ["get_block_header", [51]],
+            ["get_block_header", [52]], ["get_block_header", [50]]]
+        assert block_time.stats["misses"] == 13
+
+    def test_global_properties(self):
+        chain = StubChain()
+
+        async def main():
+            block_time, websocket = resolver(chain, estimate=True)
+            block_time.update_global_properties(chain.global_properties)
+            head = await block_time.timestamp(100)
+            estimated = await block_time.timestamp(90)
+            far = await block_time.timestamp(100 - 1001)
+            return block_time, websocket.sent, head, estimated, far
+        block_time, sent, head, estimated, far = run(main())
+        assert head == chain.timestamp(100)
+        assert estimated == chain.timestamp(90)
+        assert block_time.stats == {"hits": 1, "misses": 1, "estimated": 1}
+        assert len(sent) == 1
+
+
+class TestTradeBlockTime(object):
+    def test_one_lookup_per_block(self):
+        chain = StubChain()
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = RecordingTrade(node.uri)
+            protocol.trades = []
+            protocol.init_statistics(None, "alice")
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            for i in range(20):
+                chain.fill((100000, "1.3.0"), (20000, "1.3.1"),
+                           block_num=101)
+            await node.notify([chain.statistics])
+            await wait_for(lambda: len(protocol.trades) == 20)
+            # the 2.1.0 notice of the next block comes before its fills
+            chain.set_head(102)
+            await node.notify([chain.global_properties])
+            chain.fill((100000, "1.3.0"), (20000, "1.3.1"), block_num=102)
+            await node.notify([chain.statistics])
+            await wait_for(lambda: len(protocol.trades) == 21)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol.trades, node.requests
+        trades, requests = run(main())
+        methods = [r["params"][1] for r in requests]
+        assert "get_block" not in methods
+        assert [r["params"][2] for r in requests
+                if r["params"][1] == "get_block_header"] == [[101]]
+        assert trades[-1]["timestamp"] == chain.timestamp(102)
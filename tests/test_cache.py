@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from bts.cache import ObjectCache
+from bts.http_rpc import HTTPRPC
+from bts.ws.base_protocol import BaseProtocol
+from stub_node import StubHTTPNode, StubWebsocket, run
+
+
+class TestObjectCache(object):
+    def test_only_immutable_objects(self):
+        cache = ObjectCache()
+        ids = ["1.11.1", "1.2.1", "2.9.1"]
+        fetch_args, partial = cache.lookup("get_objects", [ids])
+        assert fetch_args == [ids]
+        reply = [{"id": _id} for _id in ids]
+        assert cache.complete("get_objects", [ids], partial, reply) == reply
+        fetch_args, partial = cache.lookup("get_objects", [ids])
+        assert fetch_args == [["1.2.1"]]
+        result = cache.complete(
+            "get_objects", [ids], partial, [{"id": "1.2.1"}])
+        assert result == reply
+        assert cache.stats()["hits"] == 2
+
+    def test_blocks_below_irreversible(self):
+        cache = ObjectCache()
+        cache.complete("get_block", [10], None, {"block_num": 10})
+        assert cache.lookup("get_block", [10])[0] == [10]
+        cache.update_global_properties({"last_irreversible_block_num": 10})
+        cache.complete("get_block", [10], None, {"block_num": 10})
+        cache.complete("get_block", [11], None, {"block_num": 11})
+        assert cache.lookup("get_block", [10]) == (None, {"block_num": 10})
+        assert cache.lookup("get_block", [11])[0] == [11]
+
+    def test_lru_and_spill(self, tmpdir):
+        cache = ObjectCache(max_size=2, spill_path=str(tmpdir.join("spill")))
+        for i in range(4):
+            cache.put("obj:1.11.%d" % i, i)
+        assert cache.stats()["size"] == 2
+        assert cache.lookup("get_objects", [["1.11.0"]]) == (
+            None, {"1.11.0": 0})
+        cache.close()
+
+
+class TestReadThrough(object):
+    def test_http_rpc(self):
+        with StubHTTPNode() as node:
+            rpc = HTTPRPC(node.uri, cache=ObjectCache())
+            for i in range(3):
+                assert rpc.get_objects(["1.11.5", "2.9.5"]) == [
+                    {"id": "1.11.5"}, {"id": "2.9.5"}]
+            assert node.stats["requests"] == 1
+            rpc.close()
+
+    def test_base_protocol(self):
+        async def main():
+            protocol = BaseProtocol(cache=ObjectCache())
+            protocol.websocket = StubWebsocket(protocol)
+            for i in range(3):
+                result = await protocol.rpc([0, "get_objects", [["1.11.5"]]])
+                assert result == [{"id": "1.11.5"}]
+            return protocol.websocket.sent
+        assert len(run(main())) == 1
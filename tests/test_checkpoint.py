@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+
+import pytest
+
+from bts.checkpoint import FileCheckpoint, SQLiteCheckpoint
+from bts.ws.trade_protocol import TradeProtocol
+from stub_node import StubChain, StubWSNode, run, wait_for
+
+
+class RecordingTrade(TradeProtocol):
+    def onTrade(self, trx):
+        self.trades.append(trx)
+
+
+@pytest.fixture(params=["file", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "file":
+        return lambda **kw: FileCheckpoint(
+            str(tmp_path / "checkpoint.json"), **kw)
+    return lambda **kw: SQLiteCheckpoint(
+        str(tmp_path / "checkpoint.db"), **kw)
+
+
+class TestCheckpoint(object):
+    def test_round_trip(self, store):
+        with store() as checkpoint:
+            assert checkpoint.load("alice") is None
+            checkpoint.save("alice", {"last_op": "1.11.5"})
+            checkpoint.save("bob", {"last_op": "1.11.7"})
+        checkpoint = store()
+        assert checkpoint.load("alice") == {"last_op": "1.11.5"}
+        assert checkpoint.load("bob") == {"last_op": "1.11.7"}
+        checkpoint.close()
+
+    def test_batched_flush(self, store):
+        checkpoint = store(flush_interval=60)
+        for i in range(100):
+            checkpoint.save("alice", {"last_op": "1.11.%d" % i})
+        assert checkpoint.flushes == 0
+        assert store().load("alice") is None
+        checkpoint.flush()
+        assert checkpoint.flushes == 1
+        assert store().load("alice") == {"last_op": "1.11.99"}
+        checkpoint.close()
+
+    def test_no_temp_file_left(self, tmp_path):
+        path = str(tmp_path / "checkpoint.json")
+        with FileCheckpoint(path, flush_interval=0) as checkpoint:
+            checkpoint.save("alice", {"last_op": "1.11.5"})
+        assert os.listdir(str(tmp_path)) == ["checkpoint.json"]
+
+
+class TestResume(object):
+    def test_resume_after_restart(self, tmp_path):
+        chain = StubChain()
+        path = str(tmp_path / "checkpoint.json")
+
+        async def monitor(fills, expected):
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = RecordingTrade(
+                node.uri, checkpoint=FileCheckpoint(path, flush_interval=60))
+            protocol.trades = []
+            protocol.init_statistics(None, "alice")
+            task = asyncio.ensure_future(protocol.handler())
+            await wait_for(protocol.ready.is_set)
+            for pays in fills:
+                chain.fill((pays, "1.3.0"), (1, "1.3.1"))
+            await node.notify([chain.statistics])
+            await wait_for(lambda: len(protocol.trades) == expected)
+            await protocol.close()
+            await task
+            await node.stop()
+            return [t["pays"][0] for t in protocol.trades]
+        assert run(monitor([100000, 200000], 2)) == [1.0, 2.0]
+        # operations while we were down are picked up, nothing twice
+        chain.fill((300000, "1.3.0"), (1, "1.3.1"))
+        assert run(monitor([400000], 2)) == [3.0, 4.0]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import pytest
+from bts.codec import get_codec
+
+
+def available_codecs():
+    codecs = []
+    for name in ("orjson", "ujson", "json"):
+        try:
+            codecs.append(get_codec(name))
+        except ImportError:
+            pass
+    return codecs
+
+
+@pytest.mark.parametrize("codec", available_codecs(), ids=repr)
+class TestCodec(object):
+    payload = {"id": 1, "method": "call",
+               "params": [0, "get_objects", [["1.2.0", u"é"]]]}
+
+    def test_dumps_bytes(self, codec):
+        data = codec.dumps(self.payload)
+        assert isinstance(data, bytes)
+        assert codec.loads(data) == self.payload
+
+    def test_loads_str(self, codec):
+        data = codec.dumps(self.payload).decode("utf8")
+        assert codec.loads(data) == self.payload
+
+    def test_invalid(self, codec):
+        with pytest.raises(ValueError):
+            codec.loads(b"{not json")
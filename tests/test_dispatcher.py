@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from bts.ws.base_protocol import BaseProtocol
+from bts.ws.dispatcher import NotificationDispatcher
+from stub_node import StubWSNode, run
+
+
+class TestNotificationDispatcher(object):
+    def test_per_object_order(self):
+        seen = {}
+
+        async def callback(notice):
+            await asyncio.sleep(random.random() / 1000)
+            seen.setdefault(notice["id"], []).append(notice["n"])
+
+        async def main():
+            dispatcher = NotificationDispatcher(workers=4)
+            dispatcher.start()
+            for n in range(50):
+                for i in range(8):
+                    object_id = "2.6.%d" % i
+                    dispatcher.submit(
+                        object_id, [callback], {"id": object_id, "n": n})
+            await dispatcher.join()
+            await dispatcher.stop()
+        run(main())
+        assert len(seen) == 8
+        assert all(ns == list(range(50)) for ns in seen.values())
+
+    @pytest.mark.parametrize("policy,kept", [
+        ("drop_newest", [0, 1]), ("drop_oldest", [3, 4])])
+    def test_drop_policies(self, policy, kept):
+        seen = []
+
+        async def main():
+            dispatcher = NotificationDispatcher(
+                workers=1, max_queue=2, policy=policy)
+            dispatcher.start()
+            for n in range(5):
+                dispatcher.submit("1.2.0", [seen.append], n)
+            await dispatcher.join()
+            await dispatcher.stop()
+            return dispatcher.stats
+        stats = run(main())
+        assert seen == kept
+        assert stats["dropped"] == 3
+
+    def test_block_policy(self):
+        release = asyncio.Event
+
+        async def main():
+            gate = release()
+
+            async def slow(notice):
+                await gate.wait()
+            dispatcher = NotificationDispatcher(workers=1, max_queue=2)
+            dispatcher.start()
+            for n in range(4):
+                dispatcher.submit("1.2.0", [slow], n)
+            waiter = asyncio.ensure_future(dispatcher.wait_ready())
+            await asyncio.sleep(0.01)
+            assert not waiter.done()
+            gate.set()
+            await asyncio.wait_for(waiter, 1)
+            await dispatcher.join()
+            await dispatcher.stop()
+            return dispatcher.stats
+        stats = run(main())
+        assert stats["processed"] == 4
+        assert stats["dropped"] == 0
+        assert stats["high_water"] == 4
+
+    def test_sync_callbacks_in_executor(self):
+        threads = []
+
+        async def main():
+            dispatcher = NotificationDispatcher(
+                workers=2, executor=ThreadPoolExecutor(2))
+            dispatcher.start()
+            for n in range(4):
+                dispatcher.submit(n, [lambda notice: threads.append(
+                    threading.current_thread())], n)
+            await dispatcher.join()
+            await dispatcher.stop()
+        run(main())
+        assert len(threads) == 4
+        assert threading.main_thread() not in threads
+
+
+class TestBaseProtocolDispatch(object):
+    def test_on_message_returns_before_callbacks(self):
+        seen = []
+
+        async def slow(notice):
+            await asyncio.sleep(0.01)
+            seen.append(notice["id"])
+
+        async def main():
+            dispatcher = NotificationDispatcher()
+            protocol = BaseProtocol(dispatcher=dispatcher)
+            dispatcher.start()
+            protocol.subscribe("2.6.", slow)
+            protocol.onMessage(
+                '{"method": "notice", "params": [200, [[{"id": "2.6.1"}, '
+                '{"id": "2.6.2"}]]]}')
+            assert seen == []
+            await dispatcher.join()
+            await dispatcher.stop()
+        run(main())
+        assert sorted(seen) == ["2.6.1", "2.6.2"]
+
+    def test_stopped_on_close(self):
+        async def main():
+            node = await StubWSNode().start()
+            dispatcher = NotificationDispatcher(workers=2)
+            protocol = BaseProtocol(node.uri, dispatcher=dispatcher)
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            workers = list(dispatcher._tasks)
+            await protocol.close()
+            await task
+            await node.stop()
+            return dispatcher, workers
+        dispatcher, workers = run(main())
+        assert len(workers) == 2 and all(w.done() for w in workers)
+        assert dispatcher._tasks == []
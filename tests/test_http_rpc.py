@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+from bts.http_rpc import HTTPRPC, RPCError, RPCConnection
+from stub_node import StubHTTPNode
+
+
+@pytest.fixture
+def node():
+    with StubHTTPNode() as _node:
+        yield _node
+
+
+class TestPooledSession(object):
+    def test_keep_alive(self, node):
+        rpc = HTTPRPC(node.uri)
+        for i in range(20):
+            assert rpc.get_objects(["1.2.%d" % i]) == [{"id": "1.2.%d" % i}]
+        assert node.stats["requests"] == 20
+        assert node.stats["connections"] == 1
+        rpc.close()
+
+    def test_rpc_error(self, node):
+        with HTTPRPC(node.uri) as rpc:
+            with pytest.raises(RPCError):
+                rpc.no_such_method()
+
+    def test_shared_across_threads(self, node):
+        rpc = HTTPRPC(node.uri, pool_maxsize=4, pool_block=True)
+        errors = []
+
+        def worker(start):
+            try:
+                for i in range(start, start + 25):
+                    assert rpc.get_block(i)["block_num"] == i
+            except Exception as err:
+                errors.append(err)
+        threads = [threading.Thread(target=worker, args=(i * 25,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert node.stats["requests"] == 200
+        assert node.stats["connections"] <= 4
+        rpc.close()
+
+    def test_idle_eviction(self, node):
+        rpc = HTTPRPC(node.uri, idle_timeout=0)
+        rpc.get_dynamic_global_properties()
+        rpc.get_dynamic_global_properties()
+        assert node.stats["connections"] == 2
+        rpc.close()
+
+
+class TestBatch(object):
+    def test_batch_round_trips(self, node):
+        rpc = HTTPRPC(node.uri)
+        with rpc.batch(max_size=100) as batch:
+            calls = [batch.get_block(i) for i in range(250)]
+        assert [c.result()["block_num"] for c in calls] == list(range(250))
+        assert node.stats["requests"] == 3
+        assert node.stats["calls"] == 250
+        ids = set(c.query["id"] for c in calls)
+        assert len(ids) == 250
+
+    def test_batch_errors_per_call(self, node):
+        rpc = HTTPRPC(node.uri)
+        batch = rpc.batch(raise_errors=False)
+        good = batch.get_block(1)
+        bad = batch.no_such_method()
+        batch.execute()
+        assert good.result()["block_num"] == 1
+        with pytest.raises(RPCError):
+            bad.result()
+
+    def test_batch_raises_first_error(self, node):
+        rpc = HTTPRPC(node.uri)
+        with pytest.raises(RPCError):
+            with rpc.batch() as batch:
+                good = batch.get_block(1)
+                batch.no_such_method()
+        assert good.result()["block_num"] == 1
+
+
+class TestEndpointPool(object):
+    def test_routes_to_fastest(self):
+        with StubHTTPNode(delay=0.05) as slow, StubHTTPNode() as fast:
+            rpc = HTTPRPC([slow.uri, fast.uri])
+            for i in range(20):
+                rpc.get_block(i)
+            assert slow.stats["requests"] == 1
+            assert fast.stats["requests"] == 19
+            rpc.close()
+
+    def test_fails_over(self):
+        with StubHTTPNode() as node:
+            down = StubHTTPNode().start()
+            down.stop()
+            rpc = HTTPRPC([down.uri, node.uri])
+            for i in range(5):
+                assert rpc.get_block(i)["block_num"] == i
+            assert node.stats["requests"] == 5
+            assert rpc.endpoints.endpoints[0].failures == 1
+            rpc.close()
+
+    def test_all_down(self):
+        down = StubHTTPNode().start()
+        down.stop()
+        rpc = HTTPRPC([down.uri, down.uri])
+        with pytest.raises(RPCConnection):
+            rpc.get_block(1)
+
+    def test_hedged_request(self):
+        with StubHTTPNode() as first, StubHTTPNode(delay=0.01) as second:
+            rpc = HTTPRPC([first.uri, second.uri], hedge=True)
+            # fixed order and hedge delay, measured ones depend on the load
+            # of the machine running the tests
+            endpoints = rpc.endpoints.endpoints
+            endpoints[0].percentile = lambda fraction, min_samples=10: 0.2
+            rpc.endpoints.ranked = lambda: endpoints
+            assert rpc.get_block(1)["block_num"] == 1
+            assert rpc.hedged == 0
+            first.delay = 1
+            start = time.time()
+            assert rpc.get_block(100)["block_num"] == 100
+            assert time.time() - start < 0.8
+            assert rpc.hedged == 1
+            assert second.stats["requests"] == 1
+            rpc.close()
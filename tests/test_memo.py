@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from bts.memo import MemoDecoder
+from bts.ws.transfer_protocol import TransferProtocol
+from graphenebase import PrivateKey
+from graphenebase import memo as Memo
+from stub_node import StubChain, StubWSNode, run, wait_for
+
+
+class RecordingTransfer(TransferProtocol):
+    def onSent(self, trx):
+        self.transfers.append(trx)
+
+    def onReceive(self, trx):
+        self.transfers.append(trx)
+
+
+def encode(sender, receiver, nonce, text):
+    return {"from": format(sender.pubkey, "BTS"),
+            "to": format(receiver.pubkey, "BTS"), "nonce": nonce,
+            "message": Memo.encode_memo(sender, receiver.pubkey, nonce, text)}
+
+
+class TestMemoDecoder(object):
+    def test_secret_cached_per_sender(self):
+        key, alice, bob = PrivateKey(), PrivateKey(), PrivateKey()
+        decoder = MemoDecoder(str(key), max_size=1)
+        texts = []
+        for sender in (alice, alice, bob, alice):
+            memo = encode(sender, key, 7, "deposit %d" % len(texts))
+            texts.append(decoder.decode(memo["from"], 7, memo["message"]))
+        assert texts == ["deposit %d" % n for n in range(4)]
+        assert decoder.stats["hits"] == 1 and decoder.stats["misses"] == 3
+        memo = encode(alice, PrivateKey(), 7, "not ours")
+        with pytest.raises(ValueError):
+            decoder.decode(memo["from"], 7, memo["message"])
+
+    def test_decode_many_in_order(self):
+        key = PrivateKey()
+        senders = [PrivateKey() for i in range(3)]
+        memos = []
+        for n in range(30):
+            memo = encode(senders[n % 3], key, n, "memo %d" % n)
+            memos.append((memo["from"], n, memo["message"]))
+        memos[5] = (memos[5][0], 6, memos[5][2])
+        decoder = MemoDecoder(str(key))
+        expected = ["memo %d" % n for n in range(30)]
+        expected[5] = None
+        assert decoder.decode_many(memos) == expected
+        with ProcessPoolExecutor(2) as executor:
+            assert decoder.decode_many(memos, executor, 4) == expected
+
+
+class TestTransferMemo(object):
+    def test_memos_decoded(self):
+        chain = StubChain()
+        key, sender = PrivateKey(), PrivateKey()
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = RecordingTransfer(node.uri)
+            protocol.transfers = []
+            protocol.init_transfer_monitor(None, "BTS", "alice", str(key))
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            for n in range(3):
+                chain.transfer("1.2.200", "1.2.100", (1000, "1.3.0"),
+                               encode(sender, key, n, "order %d" % n))
+            chain.transfer("1.2.100", "1.2.200", (1000, "1.3.0"),
+                           encode(key, sender, 9, "refund"))
+            await node.notify([chain.statistics])
+            await wait_for(lambda: len(protocol.transfers) == 4)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol
+        protocol = run(main())
+        assert [trx["memo"] for trx in protocol.transfers] == [
+            "order 0", "order 1", "order 2", "refund"]
+        # one secret for the sender, used both ways
+        assert protocol.memo_decoder.stats["misses"] == 1
+
+    def test_pages_decoded_in_pool(self):
+        chain = StubChain()
+        key, sender = PrivateKey(), PrivateKey()
+
+        async def main(executor):
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = RecordingTransfer(node.uri)
+            protocol.transfers = []
+            protocol.init_transfer_monitor(
+                None, "BTS", "alice", str(key), executor)
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            for n in range(5):
+                chain.transfer("1.2.200", "1.2.100", (1000, "1.3.0"),
+                               encode(sender, key, n, "order %d" % n))
+            chain.transfer("1.2.200", "1.2.100", (1000, "1.3.0"))
+            await node.notify([chain.statistics])
+            await wait_for(lambda: len(protocol.transfers) == 6)
+            # the backfill goes through the pool as well
+            await protocol.backfill("alice", page_size=2).run()
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol
+        with ProcessPoolExecutor(2) as executor:
+            protocol = run(main(executor))
+        memos = ["order %d" % n for n in range(5)] + [None]
+        assert [trx["memo"] for trx in protocol.transfers] == memos * 2
+        # nothing was decoded on the event loop
+        assert protocol.memo_decoder.stats["misses"] == 0
+        assert protocol.memo_texts == {}
+
+    def test_invalid_key(self):
+        chain = StubChain()
+        sender = PrivateKey()
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = RecordingTransfer(node.uri)
+            protocol.transfers = []
+            protocol.init_transfer_monitor(None, "BTS", "alice", "invalid")
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            chain.transfer("1.2.200", "1.2.100", (1000, "1.3.0"),
+                           encode(sender, PrivateKey(), 1, "order"))
+            await node.notify([chain.statistics])
+            await wait_for(lambda: len(protocol.transfers) == 1)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol
+        protocol = run(main())
+        assert protocol.memo_decoder is None
+        assert protocol.transfers[0]["memo"] is None
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import pytest
+from bts.http_rpc import HTTPRPC, RPCError
+from bts.metrics import Histogram, RPCMetrics
+from bts.ws.base_protocol import BaseProtocol, RPCError as WSRPCError
+from stub_node import StubHTTPNode, StubWebsocket, run
+
+
+class TestHistogram(object):
+    def test_percentiles(self):
+        histogram = Histogram()
+        for i in range(1, 101):
+            histogram.record(i / 1000.0)
+        assert histogram.percentile(0.5) == pytest.approx(0.05, rel=0.25)
+        assert histogram.percentile(0.95) == pytest.approx(0.095, rel=0.25)
+        assert histogram.percentile(0.99) <= 0.1
+        assert Histogram().percentile(0.5) is None
+
+
+class TestInstrumentation(object):
+    def test_http_rpc(self):
+        metrics = RPCMetrics()
+        with StubHTTPNode() as node:
+            rpc = HTTPRPC(node.uri, metrics=metrics)
+            for i in range(10):
+                rpc.get_block(i)
+            with pytest.raises(RPCError):
+                rpc.no_such_method()
+            rpc.close()
+        snapshot = metrics.snapshot()
+        block = snapshot["database.get_block"]
+        assert block["calls"] == 10
+        assert block["errors"] == 0
+        assert block["bytes_sent"] > 0 and block["bytes_received"] > 0
+        assert block["p50"] <= block["p95"] <= block["p99"]
+        assert snapshot["database.no_such_method"]["errors"] == 1
+        metrics.record_queue_delay("bulk", 0.1)
+        metrics.record_ready(0.1)
+        metrics.reset()
+        assert metrics.snapshot() == {}
+        assert metrics.queue_delays() == {}
+        assert metrics.ready_times()["count"] == 0
+
+    def test_base_protocol(self):
+        metrics = RPCMetrics()
+
+        async def main():
+            protocol = BaseProtocol(metrics=metrics)
+            protocol.websocket = StubWebsocket(protocol)
+            protocol.api_names[2] = "database"
+            await protocol.rpc([2, "get_objects", [["1.2.0"]]])
+            with pytest.raises(WSRPCError):
+                await protocol.rpc([2, "no_such_method", []])
+        run(main())
+        snapshot = metrics.snapshot()
+        assert snapshot["database.get_objects"]["calls"] == 1
+        assert snapshot["database.no_such_method"]["errors"] == 1
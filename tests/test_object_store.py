@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import json
+
+from bts.ws.base_protocol import BaseProtocol
+from bts.ws.object_store import MISSING, ObjectStore
+from stub_node import StubChain, StubWebsocket, run
+
+
+def notice(*objects):
+    return json.dumps(
+        {"method": "notice", "params": [200, [list(objects)]]})
+
+
+def protocol_with_store(chain, **kw):
+    protocol = BaseProtocol(objects=ObjectStore(**kw))
+    protocol.websocket = StubWebsocket(protocol, chain.handlers())
+    return protocol
+
+
+class TestObjectStore(object):
+    def test_space_limits(self):
+        store = ObjectStore(max_objects=5, limits={"2.9": 2})
+        for n in range(4):
+            store.apply({"id": "2.9.%d" % n})
+        assert [store.get("2.9.%d" % n) is MISSING for n in range(4)] == [
+            True, True, False, False]
+        for n in range(4):
+            store.apply({"id": "1.2.%d" % n})
+        # the largest space gives up its oldest object
+        assert len(store) == 5
+        assert "1.2.0" not in store and "2.9.2" in store
+        assert store.stats["evictions"] == 3
+
+    def test_versions_and_age(self):
+        store = ObjectStore(max_age=10)
+        store.apply({"id": "2.1.0", "head_block_number": 100})
+        store.apply({"id": "1.3.0", "symbol": "BTS"})
+        store.apply({"id": "2.1.0", "head_block_number": 111})
+        assert store.version("1.3.0") == 100
+        assert store.version("2.1.0") == 111
+        assert store.get("1.3.0") is MISSING
+        store.apply("1.3.0")
+        assert store.version("1.3.0") is None
+
+    def test_reply_older_than_notice(self):
+        store = ObjectStore()
+        fetch_args, partial = store.lookup("get_objects", [["1.2.1"]])
+        assert fetch_args == [["1.2.1"]]
+        store.apply({"id": "1.2.1", "name": "new"})
+        result = store.complete("get_objects", [["1.2.1"]], partial,
+                                [{"id": "1.2.1", "name": "old"}])
+        assert result[0]["name"] == "old"
+        assert store.get("1.2.1")["name"] == "new"
+
+
+class TestProtocolObjects(object):
+    def test_answered_locally(self):
+        chain = StubChain()
+
+        async def main():
+            protocol = protocol_with_store(chain)
+            api = protocol.node_api
+            first = await api.get_objects(["1.2.100", "1.3.0"])
+            second = await api.get_objects(["1.3.0", "1.2.100", "1.2.200"])
+            protocol.onMessage(notice(
+                {"id": "1.2.100", "name": "alice2"}, "1.3.0"))
+            third = await api.get_objects(["1.2.100", "1.3.0"])
+            return protocol, first, second, third
+        protocol, first, second, third = run(main())
+        assert second[:2] == first[::-1]
+        assert second[2]["name"] == "bob"
+        assert third[0]["name"] == "alice2"
+        assert third[1]["symbol"] == "BTS"
+        assert [r["params"][2] for r in protocol.websocket.sent] == [
+            [["1.2.100", "1.3.0"]], [["1.2.200"]], [["1.3.0"]]]
+        assert protocol.objects.stats["hits"] == 3
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import random
+import time
+
+import pytest
+
+from bts.ws.pipeline import OrderedPipeline
+from stub_node import run
+
+
+class TestOrderedPipeline(object):
+    def pipeline(self, items, resolve, **kw):
+        async def main():
+            delivered = []
+            pipeline = OrderedPipeline(resolve, delivered.append, **kw)
+            try:
+                for item in items:
+                    await pipeline.put(item)
+                await pipeline.join()
+            finally:
+                await pipeline.close()
+            return pipeline, delivered
+        return run(main())
+
+    def test_in_order(self):
+        rand = random.Random(0)
+        resolving = []
+
+        async def resolve(item):
+            resolving.append(item)
+            await asyncio.sleep(rand.random() * 0.01)
+            resolving.remove(item)
+            return item * 2
+        pipeline, delivered = self.pipeline(
+            range(200), resolve, concurrency=8, max_pending=32)
+        assert delivered == [item * 2 for item in range(200)]
+        assert pipeline.stats["high_water"] == 32
+
+    def test_concurrent(self):
+        async def resolve(item):
+            await asyncio.sleep(0.05)
+            return item
+        start = time.time()
+        pipeline, delivered = self.pipeline(range(16), resolve)
+        # sixteen resolves at once, not one after the other
+        assert time.time() - start < 0.4
+        assert delivered == list(range(16))
+
+    def test_nothing_after_error(self):
+        async def main():
+            delivered = []
+
+            async def resolve(item):
+                if item == 3:
+                    await asyncio.sleep(0.01)
+                    raise ValueError("broken")
+                return item
+            pipeline = OrderedPipeline(resolve, delivered.append)
+            for item in range(10):
+                await pipeline.put(item)
+            with pytest.raises(ValueError):
+                await pipeline.join()
+            await pipeline.close()
+            return delivered
+        assert run(main()) == [0, 1, 2]
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+from bts.http_rpc import HTTPRPC
+from bts.metrics import RPCMetrics
+from bts.ws.base_protocol import BaseProtocol
+from bts.ws.statistics_protocol import StatisticsProtocol
+from bts.ws.trade_protocol import TradeProtocol
+from stub_node import (
+    StubChain, StubError, StubHTTPNode, StubWebsocket, StubWSNode,
+    login_handlers, run, wait_for)
+
+
+class RecordingTrade(TradeProtocol):
+    def onTrade(self, trx):
+        self.trades.append(trx)
+
+
+class TestNodeAPI(object):
+    def test_api_ids(self):
+        async def main():
+            protocol = BaseProtocol()
+            protocol.websocket = StubWebsocket(protocol, {
+                "get_account_history": lambda *args: ["history"]})
+            protocol.database_api, protocol.history_api = 2, 3
+            await protocol.node_api.get_objects(["1.2.0"])
+            await protocol.node_api.history.get_account_history(
+                "1.2.0", "1.11.0", 100, "1.11.0")
+            return protocol.websocket.sent
+        sent = run(main())
+        assert sent[0]["params"] == [2, "get_objects", [["1.2.0"]]]
+        assert sent[1]["params"][:2] == [3, "get_account_history"]
+
+
+class TestHandshake(object):
+    def open(self, delay, **kw):
+        async def main():
+            protocol = BaseProtocol(**kw)
+            handlers = login_handlers()
+            handlers["set_subscribe_callback"] = lambda *args: None
+            protocol.websocket = StubWebsocket(protocol, handlers, delay)
+            start = time.time()
+            await protocol.onOpen()
+            return protocol, time.time() - start
+        return run(main())
+
+    def test_pipelined(self):
+        protocol, elapsed = self.open(0.1)
+        # login and the three lookups in one round trip, then subscribe
+        assert elapsed < 0.35
+        assert [r["params"][1] for r in protocol.websocket.sent] == [
+            "login", "database", "history", "network_broadcast",
+            "set_subscribe_callback"]
+        assert protocol.api_names == {
+            1: "login", 2: "database", 3: "history", 4: "network_broadcast"}
+        assert protocol.websocket.sent[-1]["params"][0] == 2
+
+    def test_preset_api_ids(self):
+        protocol, elapsed = self.open(
+            0.1, apis=("database",), api_ids={"database": 2})
+        assert elapsed < 0.18
+        assert [r["params"][1] for r in protocol.websocket.sent] == [
+            "login", "set_subscribe_callback"]
+
+    def test_ready(self):
+        async def main():
+            node = await StubWSNode().start()
+            protocol = BaseProtocol(node.uri, metrics=RPCMetrics())
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol
+        protocol = run(main())
+        assert protocol.ready_time > 0
+        assert protocol.metrics.ready_times()["count"] == 1
+        assert "connection.ready" not in protocol.metrics.snapshot()
+        assert not protocol.ready.is_set()
+
+
+class TestTradeProtocol(object):
+    def test_fills_over_websocket(self):
+        chain = StubChain()
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = RecordingTrade(node.uri)
+            protocol.trades = []
+            protocol.init_statistics(None, "alice")
+            task = asyncio.ensure_future(protocol.handler())
+            await wait_for(protocol.ready.is_set)
+            chain.fill((100000, "1.3.0"), (20000, "1.3.1"))
+            chain.fill((50000, "1.3.1"), (300000, "1.3.0"))
+            await node.notify([chain.statistics])
+            await wait_for(lambda: len(protocol.trades) == 2)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol.trades
+        trades = run(main())
+        amounts = sorted((t["pays"], t["receives"]) for t in trades)
+        assert amounts == [([1.0, "BTS"], [2.0, "CNY"]),
+                           ([5.0, "CNY"], [3.0, "BTS"])]
+        assert all(t["timestamp"].startswith("2016-08-01") for t in trades)
+
+    def test_blocking_node_api(self):
+        chain = StubChain()
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            with StubHTTPNode(chain.handlers()) as http:
+                rpc = HTTPRPC(http.uri)
+                protocol = RecordingTrade(node.uri)
+                protocol.trades = []
+                protocol.init_statistics(rpc, "alice")
+                task = asyncio.ensure_future(protocol.handler())
+                await wait_for(protocol.ready.is_set)
+                chain.fill((100000, "1.3.0"), (20000, "1.3.1"))
+                await node.notify([chain.statistics])
+                await wait_for(lambda: len(protocol.trades) == 1)
+                await protocol.close()
+                await task
+                rpc.close()
+            await node.stop()
+            return protocol.trades, http.stats
+        trades, stats = run(main())
+        assert trades[0]["pays"] == [1.0, "BTS"]
+        assert trades[0]["receives"] == [2.0, "CNY"]
+        # the block time and the assets were looked up over HTTP
+        assert stats["calls"] > 0
+
+    def test_catch_up_in_pages(self):
+        chain = StubChain()
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = RecordingTrade(node.uri)
+            protocol.trades = []
+            protocol.init_statistics(None, "alice")
+            # resume from the sentinel entry, 250 operations behind
+            protocol.last_trx = "2.9.9"
+            for i in range(250):
+                chain.fill((i + 1, "1.3.0"), (1, "1.3.1"), block_num=101)
+            task = asyncio.ensure_future(protocol.handler())
+            await wait_for(lambda: len(protocol.trades) == 250)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol, node.requests
+        protocol, requests = run(main())
+        pays = [t["pays"][0] for t in protocol.trades]
+        assert pays == [(i + 1) / 1e5 for i in range(250)]
+        pages = [r["params"][2] for r in requests
+                 if r["params"][1] == "get_relative_account_history"]
+        assert pages == [["1.2.100", 1, 100, 100], ["1.2.100", 101, 100, 200],
+                         ["1.2.100", 201, 50, 250]]
+        assert not [r for r in requests if r["params"][1] == "get_objects"
+                    and r["params"][2][0][0].startswith("1.11.")]
+        assert protocol.last_seq == 250
+        assert protocol.last_trx == chain.statistics["most_recent_op"]
+
+
+class RecordingStatistics(StatisticsProtocol):
+    async def process_operation(self, operation, account):
+        self.processed.append((account["name"], operation["id"]))
+
+
+class TestMultiAccount(object):
+    def test_fair_catch_up(self):
+        chain = StubChain()
+        for n in range(3, 10):
+            chain.add_account("user%d" % n, "1.2.%d00" % n)
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = RecordingStatistics(node.uri)
+            protocol.catch_up_workers = 1
+            protocol.processed = []
+            names = ["alice", "bob"] + ["user%d" % n for n in range(3, 10)]
+            protocol.init_statistics(None, names)
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            for i in range(300):
+                chain.fill((1, "1.3.0"), (1, "1.3.1"))
+            for i in range(5):
+                chain.fill((1, "1.3.0"), (1, "1.3.1"), account="1.2.200")
+            await node.notify([chain.statistics, chain.statistics_of(
+                "1.2.200")])
+            await wait_for(lambda: len(protocol.processed) == 305)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol, node.requests
+        protocol, requests = run(main())
+        # one subscription and one get_objects for all statistics objects
+        assert list(protocol.callbacks) == ["2.6.", "2.1.0"]
+        assert protocol.assets is None
+        assert [r["params"][2][0] for r in requests
+                if r["params"][1] == "get_objects" and
+                r["params"][2][0][0].startswith("2.6.")] == [
+                    ["2.6.100", "2.6.200"] +
+                    ["2.6.%d00" % n for n in range(3, 10)]]
+        # bob is done after alice's first page, not after all of hers
+        accounts = [name for name, op_id in protocol.processed]
+        assert accounts[100:105] == ["bob"] * 5
+        alice = [op_id for name, op_id in protocol.processed
+                 if name == "alice"]
+        assert alice == sorted(alice, key=lambda _id: int(_id[5:]))
+        assert protocol.accounts.state(1)["last_seq"] == 5
+
+    def test_retry_after_error(self):
+        chain = StubChain()
+        handlers = chain.handlers()
+        history = handlers["get_relative_account_history"]
+        pages = []
+
+        def flaky_history(*args):
+            pages.append(args)
+            if len(pages) == 1:
+                raise StubError("busy")
+            return history(*args)
+        handlers["get_relative_account_history"] = flaky_history
+
+        async def main():
+            node = await StubWSNode(handlers).start()
+            protocol = RecordingStatistics(node.uri)
+            protocol.retry_delay = 0.01
+            protocol.processed = []
+            protocol.init_statistics(None, "alice")
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            for i in range(3):
+                chain.fill((1, "1.3.0"), (1, "1.3.1"))
+            await node.notify([chain.statistics])
+            # caught up without another notice
+            await wait_for(lambda: len(protocol.processed) == 3)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol
+        protocol = run(main())
+        assert len(pages) == 2
+        assert protocol._retry_delays == {} and protocol._retries == {}
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+from bts.ws.base_protocol import BaseProtocol, RPCConnection
+from bts.ws.trade_protocol import TradeProtocol
+from stub_node import StubChain, StubError, StubWSNode, run, wait_for
+
+
+class RecordingTrade(TradeProtocol):
+    def onTrade(self, trx):
+        self.trades.append(trx)
+
+
+class FailingProtocol(BaseProtocol):
+    def onMessage(self, payload):
+        if b"notice" in payload:
+            raise RuntimeError("boom")
+        super(FailingProtocol, self).onMessage(payload)
+
+
+class TestReconnect(object):
+    def test_open_failure_reconnects(self):
+        lookups = []
+
+        def history():
+            lookups.append(1)
+            if len(lookups) == 1:
+                raise StubError("not ready")
+            return 3
+
+        async def main():
+            node = await StubWSNode({"history": history}).start()
+            protocol = BaseProtocol(node.uri, reconnect_delay=0.01)
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            block = await asyncio.wait_for(
+                protocol.node_api.get_block(5), 2)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol, block
+        protocol, block = run(main())
+        assert len(lookups) == 2
+        assert protocol.connections == 2
+        assert protocol.history_api == 3 and block["block_num"] == 5
+
+    def test_callback_and_decode_errors(self):
+        def callback(notice):
+            raise KeyError("boom")
+
+        async def main():
+            node = await StubWSNode().start()
+            protocol = BaseProtocol(node.uri, reconnect_delay=0.01)
+            protocol.subscribe("2.6.", callback)
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            await node.notify([{"id": "2.6.100"}])
+            for websocket in list(node.connections):
+                await websocket.send("not json")
+            block = await asyncio.wait_for(
+                protocol.node_api.get_block(5), 2)
+            assert not task.done()
+            assert protocol.connections == 1
+            await protocol.close()
+            await task
+            await node.stop()
+            return block
+        assert run(main()) is not None
+
+    def test_unexpected_error_fails_pending(self):
+        async def main():
+            node = await StubWSNode().start()
+            protocol = FailingProtocol(
+                node.uri, reconnect_delay=0.01, replay=True)
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            node.delay = 10
+            call = asyncio.ensure_future(protocol.node_api.get_block(5))
+            await wait_for(lambda: protocol.result, timeout=3)
+            await node.notify([{"id": "2.6.100"}])
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(task, 2)
+            with pytest.raises(RPCConnection):
+                await asyncio.wait_for(call, 2)
+            assert not protocol.ready.is_set()
+            await node.stop()
+        run(main())
+
+    def test_pending_requests_fail(self):
+        async def main():
+            node = await StubWSNode().start()
+            protocol = BaseProtocol(node.uri, reconnect_delay=0.01)
+            task = asyncio.ensure_future(protocol.handler())
+            await wait_for(lambda: node.subscribe_id is not None, timeout=3)
+            node.delay = 10
+            call = asyncio.ensure_future(
+                protocol.node_api.get_block(5))
+            await wait_for(lambda: protocol.result, timeout=3)
+            await node.stop()
+            with pytest.raises(RPCConnection):
+                await call
+            assert protocol.result == {}
+            await protocol.close()
+            await task
+        run(main())
+
+    def test_replay_with_new_api_ids(self):
+        async def main():
+            node = await StubWSNode().start()
+            protocol = BaseProtocol(
+                node.uri, reconnect_delay=0.01, replay=True)
+            task = asyncio.ensure_future(protocol.handler())
+            await wait_for(lambda: node.subscribe_id is not None, timeout=3)
+            node.delay = 10
+            call = asyncio.ensure_future(protocol.node_api.get_block(5))
+            await wait_for(lambda: protocol.result, timeout=3)
+            await node.stop()
+            node = await StubWSNode({"database": lambda: 7}).start(
+                node.port)
+            block = await asyncio.wait_for(call, 3)
+            assert block["block_num"] == 5
+            assert protocol.database_api == 7
+            assert node.requests[-1]["params"] == [7, "get_block", [5]]
+            await protocol.close()
+            await task
+            await node.stop()
+        run(main())
+
+    def test_resync_after_restart(self):
+        chain = StubChain()
+
+        async def main():
+            node = await StubWSNode(chain.handlers()).start()
+            protocol = RecordingTrade(node.uri, reconnect_delay=0.01)
+            protocol.trades = []
+            protocol.init_statistics(None, "alice")
+            task = asyncio.ensure_future(protocol.handler())
+            await wait_for(protocol.ready.is_set, timeout=3)
+            await node.stop()
+            for i in range(3):
+                chain.fill((100000, "1.3.0"), (20000, "1.3.1"))
+            node = await StubWSNode(chain.handlers()).start(node.port)
+            await wait_for(lambda: len(protocol.trades) == 3, timeout=3)
+            assert len(protocol.callbacks["2.6."]) == 1
+            await protocol.close()
+            await task
+            await node.stop()
+        run(main())
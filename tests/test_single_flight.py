@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+
+import pytest
+from bts.http_rpc import HTTPRPC, RPCError
+from bts.ws.single_flight import AsyncSingleFlight
+from bts.ws.base_protocol import BaseProtocol
+from stub_node import StubHTTPNode, StubWebsocket, run
+
+
+class TestHTTPRPC(object):
+    def call_concurrently(self, rpc, method, args, count=8):
+        results = []
+        barrier = threading.Barrier(count)
+
+        def worker():
+            barrier.wait()
+            try:
+                results.append(getattr(rpc, method)(*args))
+            except RPCError as err:
+                results.append(err)
+        threads = [threading.Thread(target=worker) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_duplicates_share_one_request(self):
+        with StubHTTPNode(delay=0.2) as node:
+            rpc = HTTPRPC(node.uri)
+            results = self.call_concurrently(rpc, "get_block", [7])
+            assert results == [results[0]] * 8
+            assert node.stats["requests"] == 1
+            assert rpc.single_flight.shared == 7
+            self.call_concurrently(rpc, "get_block", [7])
+            assert node.stats["requests"] == 2
+            rpc.close()
+
+    def test_errors_are_shared(self):
+        with StubHTTPNode(delay=0.2) as node:
+            rpc = HTTPRPC(node.uri)
+            results = self.call_concurrently(rpc, "no_such_method", [])
+            assert all(isinstance(r, RPCError) for r in results)
+            assert node.stats["requests"] == 1
+            rpc.close()
+
+    def test_disabled(self):
+        with StubHTTPNode(delay=0.1) as node:
+            rpc = HTTPRPC(node.uri, coalesce=False)
+            self.call_concurrently(rpc, "get_block", [7], count=4)
+            assert node.stats["requests"] == 4
+            rpc.close()
+
+
+class TestBaseProtocol(object):
+    def test_duplicates_share_one_request(self):
+        async def main():
+            protocol = BaseProtocol()
+            protocol.websocket = StubWebsocket(protocol, delay=0.01)
+            results = await asyncio.gather(
+                *[protocol.rpc([0, "get_block", [7]]) for i in range(5)],
+                *[protocol.rpc([0, "get_objects", [["1.3.0"]]])
+                  for i in range(5)])
+            assert results[:5] == [results[0]] * 5
+            assert results[5:] == [[{"id": "1.3.0"}]] * 5
+            return protocol.websocket.sent
+        assert len(run(main())) == 2
+
+    def test_cancelled_waiter_keeps_call(self):
+        async def main():
+            flight = AsyncSingleFlight()
+            done = asyncio.Event()
+
+            async def slow():
+                await done.wait()
+                return 42
+            first = asyncio.ensure_future(flight.do("k", slow))
+            second = asyncio.ensure_future(flight.do("k", slow))
+            await asyncio.sleep(0)
+            first.cancel()
+            done.set()
+            assert await second == 42
+            with pytest.raises(asyncio.CancelledError):
+                await first
+        run(main())
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import random
+
+from bts.ws.base_protocol import BaseProtocol
+from bts.ws.subscriptions import SubscriptionIndex
+
+
+def prefix_match(callbacks, object_id):
+    # the matching BaseProtocol.onMessage used to do
+    return [_cb for _id in callbacks if _id == object_id[:len(_id)]
+            for _cb in callbacks[_id]]
+
+
+class TestSubscriptionIndex(object):
+    def test_same_as_prefix_matching(self):
+        rand = random.Random(1)
+        index = SubscriptionIndex()
+        reference = {}
+        keys = ["1.2.", "2.6.", "1.2.1", "1.2.10", "", "2.9.5", "1.11."]
+        keys += ["%d.%d.%d" % (rand.choice([1, 2]), rand.randint(1, 12),
+                               rand.randint(0, 200)) for i in range(300)]
+        for i, key in enumerate(keys):
+            index.add(key, i)
+            reference.setdefault(key, []).append(i)
+        for i in range(2000):
+            object_id = "%d.%d.%d" % (
+                rand.choice([1, 2]), rand.randint(1, 12),
+                rand.randint(0, 2000))
+            assert index.match(object_id) == prefix_match(
+                reference, object_id)
+
+    def test_remove(self):
+        index = SubscriptionIndex()
+        index.add("1.2.", "a")
+        index.add("1.2.", "b")
+        index.add("1.2.5", "c")
+        index.remove("1.2.", "a")
+        assert index.match("1.2.5") == ["b", "c"]
+        index.remove("1.2.")
+        index.remove("1.2.5", "c")
+        assert index.match("1.2.5") == []
+        assert len(index) == 0
+        index.remove("not.there")
+
+
+class TestDispatch(object):
+    def test_on_message(self):
+        protocol = BaseProtocol()
+        seen = []
+        protocol.subscribe("2.6.", lambda n: seen.append(("space", n["id"])))
+        protocol.subscribe("2.6.1", lambda n: seen.append(("id", n["id"])))
+        protocol.subscribe("removed", lambda n: seen.append(("removed", n)))
+        protocol.onMessage(
+            '{"method": "notice", "params": [200, [[{"id": "2.6.12"}, '
+            '{"id": "1.2.0"}, "1.7.5"]]]}')
+        assert seen == [("space", "2.6.12"), ("id", "2.6.12"),
+                        ("removed", "1.7.5")]
+        protocol.unsubscribe("2.6.")
+        seen[:] = []
+        protocol.onMessage(
+            '{"method": "notice", "params": [200, [[{"id": "2.6.12"}]]]}')
+        assert seen == [("id", "2.6.12")]
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from bts.metrics import RPCMetrics
+from bts.ws.base_protocol import BaseProtocol, RPCTimeout
+from bts.ws.window import RequestWindow
+from stub_node import StubWebsocket, StubWSNode, run
+
+
+class BusyOpen(BaseProtocol):
+    async def onOpen(self):
+        await super(BusyOpen, self).onOpen()
+        self.blocks = await asyncio.gather(
+            *[self.node_api.get_block(n) for n in range(3)])
+
+
+class TestRequestWindow(object):
+    def test_fifo(self):
+        async def main():
+            window = RequestWindow(1)
+            order = []
+
+            async def request(n):
+                await window.acquire()
+                order.append(n)
+                await asyncio.sleep(0.01)
+                window.release()
+            await asyncio.gather(*[request(n) for n in range(5)])
+            return window, order
+        window, order = run(main())
+        assert order == [0, 1, 2, 3, 4]
+        assert window.in_flight == 0
+        assert window.stats == {"queued": 4, "high_water": 1}
+
+    def test_cancelled_waiter(self):
+        async def main():
+            window = RequestWindow(1)
+            await window.acquire()
+            waiter = asyncio.ensure_future(window.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+            window.release()
+            return window
+        window = run(main())
+        assert window.in_flight == 0
+        assert window.waiting() == 0
+
+    def test_lanes(self):
+        async def main():
+            window = RequestWindow(1)
+            order = []
+
+            async def request(lane):
+                await window.acquire(lane)
+                order.append(lane)
+                await asyncio.sleep(0.01)
+                window.release(lane)
+            await asyncio.gather(*[request(lane) for lane in (
+                "bulk", "bulk", "normal", "bulk", "realtime", "normal")])
+            return order
+        assert run(main()) == [
+            "bulk", "realtime", "normal", "normal", "bulk", "bulk"]
+
+    def test_max_bulk(self):
+        async def main():
+            window = RequestWindow(max_bulk=2)
+            for i in range(2):
+                await window.acquire("bulk")
+            waiter = asyncio.ensure_future(window.acquire("bulk"))
+            # the other lanes still get in
+            await window.acquire("normal")
+            await asyncio.sleep(0)
+            assert not waiter.done()
+            window.release("bulk")
+            await waiter
+            return window
+        window = run(main())
+        assert window.lane_in_flight == {
+            "realtime": 0, "normal": 1, "bulk": 2}
+
+    def test_unknown_lane(self):
+        with pytest.raises(ValueError):
+            run(RequestWindow(1).acquire("urgent"))
+
+
+class TestDeadlines(object):
+    def test_timeout_cleans_up(self):
+        async def main():
+            protocol = BaseProtocol(timeout=0.05)
+            protocol.websocket = StubWebsocket(protocol, delay=0.2)
+            with pytest.raises(RPCTimeout):
+                await protocol.node_api.get_objects(["1.2.0"])
+            # a per call deadline wins over the default
+            ret = await protocol.node_api.get_objects(["1.2.1"], timeout=1)
+            await asyncio.sleep(0.3)
+            return protocol, ret
+        protocol, ret = run(main())
+        assert ret == [{"id": "1.2.1"}]
+        assert protocol.result == {} and protocol.requests == {}
+
+    def test_cancel_cleans_up(self):
+        async def main():
+            protocol = BaseProtocol(max_in_flight=1)
+            protocol.websocket = StubWebsocket(protocol, delay=0.2)
+            tasks = [asyncio.ensure_future(
+                protocol.node_api.get_objects(["1.2.%d" % n]))
+                for n in range(3)]
+            await asyncio.sleep(0.01)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            return protocol
+        protocol = run(main())
+        assert protocol.result == {} and protocol.requests == {}
+        assert protocol.window.in_flight == 0
+
+    def test_max_in_flight(self):
+        async def main():
+            protocol = BaseProtocol(max_in_flight=2)
+            in_flight = []
+            protocol.websocket = StubWebsocket(protocol, {
+                "get_objects": lambda ids: in_flight.append(
+                    len(protocol.result))}, delay=0.01)
+            await asyncio.gather(*[
+                protocol.node_api.get_objects(["1.2.%d" % n])
+                for n in range(10)])
+            return in_flight
+        in_flight = run(main())
+        assert len(in_flight) == 10
+        assert max(in_flight) == 2
+
+    def test_request_id_wraps(self):
+        protocol = BaseProtocol()
+        protocol.request_id = 2**31 - 1
+        protocol.result[0] = None
+        assert protocol.next_request_id() == 2**31 - 1
+        assert protocol.next_request_id() == 1
+
+    def test_lane_metrics(self):
+        async def main():
+            protocol = BaseProtocol(
+                max_in_flight=1, metrics=RPCMetrics())
+            protocol.websocket = StubWebsocket(protocol, delay=0.01)
+            await asyncio.gather(*[
+                protocol.node_api.get_objects(["1.2.%d" % n], priority=lane)
+                for n, lane in enumerate(["bulk"] * 3 + ["realtime"])])
+            return protocol.metrics
+        metrics = run(main())
+        delays = metrics.queue_delays()
+        assert delays["bulk"]["count"] == 3
+        # realtime waited for one request only, bulk for up to three
+        assert delays["realtime"]["max"] < delays["bulk"]["max"]
+        # the methods called are all there is in the snapshot
+        assert list(metrics.snapshot()) == ["0.get_objects"]
+
+    def test_window_while_opening(self):
+        async def main():
+            node = await StubWSNode().start()
+            protocol = BusyOpen(node.uri, max_in_flight=1)
+            task = asyncio.ensure_future(protocol.handler())
+            await asyncio.wait_for(protocol.ready.wait(), 2)
+            await protocol.close()
+            await task
+            await node.stop()
+            return protocol
+        protocol = run(main())
+        assert len(protocol.blocks) == 3
+        # only the requests of onOpen queued, not the handshake
+        assert protocol.window.stats["queued"] == 2
+        assert protocol.window.stats["high_water"] == 1